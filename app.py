@@ -1,29 +1,121 @@
+import time
+_import_started = time.perf_counter()
 import os
+import io
+import csv
 import json
-import unicodedata
-from sqlalchemy import select, func
-from db import engine, SessionLocal
+import hashlib
+from functools import wraps
+from sqlalchemy import select, func, insert, update, delete
+from db import engine, read_engine, SessionLocal, ReadSessionLocal
 from datetime import date, datetime
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
 from flask_httpauth import HTTPDigestAuth
-from models import (Base, Item, ItemGroup, Tag,
-                    Location, Battery, tag_association,)
+from models import (Item, ItemGroup, Tag,
+                    Location, Battery, normalize,
+                    init_db, refresh_location_paths, LOCATION_PATH_LENGTH,
+                    get_data_version, bump_data_version, with_normalized_columns,
+                    refresh_fulltext, refresh_fulltext_items, location_subtree, FULLTEXT_DIALECTS,
+                    LocationStats, GroupStats, TagStats, rollup_items,
+                    rollup_moved_location, rollup_regrouped, group_state, rebuild_rollups,)
+from search_index import AutocompleteIndex
+from cache import AutocompleteCache
+from metrics import metrics
+import search
+import slow_queries
+import timing
+import tokens
 # do not import return abort!!!!!!!
-from flask import Flask, jsonify, request, render_template, send_from_directory
-app = Flask(__name__)
-auth = HTTPDigestAuth()
-#app.config['APPLICATION_ROOT'] = '/inventory' # there's another const in the js
-Base.metadata.create_all(engine)
-
+import click
+from flask import (Blueprint, Flask, Response, current_app, g, jsonify, request,
+                   render_template, send_from_directory)
+bp = Blueprint("inventory", __name__, cli_group=None)
+
+
+class DigestOrTokenAuth(HTTPDigestAuth):
+    """
+    digest auth that also accepts a signed session token (cookie, or "Authorization: Bearer ..."),
+    handed out after a successful digest login when TOKEN_AUTH is on: no 401 challenge round-trip
+    on every new request. without a valid token it is plain digest auth
+    """
+
+    def authenticate(self, auth, stored_password):
+        if current_app.config.get("TOKEN_AUTH"):
+            user = token_user()
+            if user:
+                return user
+        ok = super().authenticate(auth, stored_password)
+        if ok and current_app.config.get("TOKEN_AUTH"):
+            g.issue_token_for = auth.username
+        return ok
+
+
+auth = DigestOrTokenAuth()
+autocomplete_index = AutocompleteIndex()
+autocomplete_cache = AutocompleteCache(size=int(os.environ.get("AUTOCOMPLETE_CACHE_SIZE", 1024)))
 users = {} 
-if os.path.exists('users.json'):
-    with open('users.json', 'r') as file:
-        users = json.load(file)
 
-# the user "server" and "Yosh" need to be mentionned here.
-# feel free to edit them. this is the only place they appear
 
-app.config['SECRET_KEY'] = users.get('server')
+def create_app(warm=False):
+    """
+    build the app: load users.json and upgrade the database if its schema is older than the models.
+    the autocomplete index is built by the first autocomplete request, or right away with warm=True:
+    gunicorn does that once before forking its workers (see gunicorn.conf.py), so they share
+    the index copy-on-write instead of each building their own
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    #app.config['APPLICATION_ROOT'] = '/inventory' # there's another const in the js
+    timings = {"import": _import_time}
+    upgraded = init_db(engine, SessionLocal)
+    timings["schema upgrade" if upgraded else "schema check"] = time.perf_counter() - started
+
+    users.clear()
+    if os.path.exists('users.json'):
+        with open('users.json', 'r') as file:
+            users.update(json.load(file))
+
+    # the user "server" and "Yosh" need to be mentionned here.
+    # feel free to edit them. this is the only place they appear
+
+    app.config['SECRET_KEY'] = users.get('server')
+    # signed session tokens, signed with SECRET_KEY (see DigestOrTokenAuth)
+    app.config['TOKEN_AUTH'] = bool(app.config['SECRET_KEY']) and \
+        os.environ.get("INVENTORY_TOKEN_AUTH", "").lower() in ("1", "true", "yes")
+    app.register_blueprint(bp)
+
+    if warm:
+        index_started = time.perf_counter()
+        with SessionLocal() as s:
+            autocomplete_index.build(s, location_paths(s), get_data_version(s))
+        timings["autocomplete index"] = time.perf_counter() - index_started
+    timings["create_app"] = time.perf_counter() - started
+    app.config["STARTUP_TIMINGS"] = timings
+    app.logger.info("startup: %s", ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in timings.items()))
+    return app
+
+
+@bp.cli.command("init-db")
+def init_db_command():
+    """Create the tables, or add the columns and indexes the models gained, and backfill them."""
+    init_db(engine, SessionLocal, force=True)
+    click.echo("database is up to date")
+
+
+@bp.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute the /api/stats rollups from the items, after writing to the database by hand."""
+    with SessionLocal() as s:
+        rebuild_rollups(s)
+    click.echo("stats rebuilt")
+
+
+@bp.cli.command("startup-report")
+def startup_report_command():
+    """Time spent starting this process. python -X importtime -c "import app" details the imports."""
+    for step, seconds in current_app.config["STARTUP_TIMINGS"].items():
+        click.echo(f"{step:>20}: {seconds * 1000:8.1f} ms")
+
 
 def is_Yosh_allowed(): # hidden items
     user = auth.current_user()
@@ -41,6 +133,77 @@ def get_pw(username):
         return users.get(username)
     return None
 
+def token_user():
+    header = request.headers.get("Authorization", "")
+    token = header[7:] if header.startswith("Bearer ") else request.cookies.get(tokens.TOKEN_COOKIE)
+    if not token:
+        return None
+    return tokens.verify(current_app.config["SECRET_KEY"], token, get_pw)
+
+
+@bp.after_request
+def set_token_cookie(response):
+    # the cookie is HttpOnly and SameSite=Strict: scripts can't read it, other sites can't send it
+    user = g.pop("issue_token_for", None)
+    if user:
+        token = tokens.sign(current_app.config["SECRET_KEY"], user, get_pw(user))
+        response.set_cookie(tokens.TOKEN_COOKIE, token, max_age=tokens.TOKEN_LIFETIME,
+                            httponly=True, samesite="Strict", secure=request.is_secure)
+    return response
+
+
+def wants_timing_debug() -> bool:
+    return request.args.get("debug") == "timing" and am_i_admin()
+
+
+@bp.before_app_request
+def start_timing():
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    g.timing_token = timing.start(f"{request.method} {rule}")
+
+
+@bp.after_app_request
+def add_server_timing(response):
+    # SQL statements and time, and the filter/serialize phases, in the browser's network tab
+    timings = timing.current()
+    if timings is None:
+        return response
+    if wants_timing_debug() and response.is_json and not response.is_streamed:
+        # admins: ?debug=timing wraps the JSON body with the timings, statements included
+        body = {"result": response.get_json(), "timing": timings.as_dict()}
+        response.set_data(current_app.json.dumps(body))
+        response.headers.pop("ETag", None)  # a 304 would replay old timings
+    response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    timings = timing.current()
+    if timings is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"  # not the raw path: bounded labels
+        metrics.observe_request(route, request.method, response.status_code, timings.total(),
+                                response.calculate_content_length())
+    return response
+
+
+@bp.teardown_app_request
+def stop_timing(exc):
+    timing.stop(g.pop("timing_token", None))
+
+
+@bp.route("/api/token", methods=["POST"])
+@auth.login_required
+def issue_token():
+    # for scripts: a bearer token, sent as "Authorization: Bearer <token>"
+    if not current_app.config.get("TOKEN_AUTH"):
+        return abort(404, "Token auth is off (INVENTORY_TOKEN_AUTH)")
+    user = auth.current_user()
+    g.pop("issue_token_for", None)
+    return {"token": tokens.sign(current_app.config["SECRET_KEY"], user, get_pw(user)),
+            "expires_in": tokens.TOKEN_LIFETIME}, 200
+
+
 # @overwrite Flask function
 def abort(resp_status, message):  # this one sends JSON instead of HTML
     return {"error": message}, resp_status
@@ -49,70 +212,117 @@ def is_autocomplete() -> bool:
     return request.args.get("autocomplete", "").lower() in ("1", "true", "yes")
 
 
-def normalize(text: str) -> str:
-    if not text:
-        return ""
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(c for c in text if not unicodedata.combining(c))
-    return text.lower().strip()
-
-
-def autocomplete(items, label_fn, limit=10):
-    seen = {}
-    for i in items:
-        seen[id(i)] = i
-    return jsonify([
-        {"id": getattr(i, "id", label_fn(i)), "label": label_fn(i)}
-        for i in list(seen.values())[:limit]
-    ])
-
-@app.route("/")
+@bp.route("/")
 @auth.login_required
 def index():
-    return render_template("index.html", user=auth.username())
+    return render_template("index.html", user=auth.current_user())
 
-@app.route("/inventory")
+@bp.route("/inventory")
 @auth.login_required
 def index2():
     return render_template("index.html")
 
-@app.route("/favicon.ico")
+@bp.route("/favicon.ico")
 @auth.login_required
 def favicon():
     return send_from_directory(
-        os.path.join(app.root_path, "static"), "Hatsune-Miku.ico", mimetype="image/vnd.microsoft.icon",)
+        os.path.join(current_app.root_path, "static"), "Hatsune-Miku.ico", mimetype="image/vnd.microsoft.icon",)
 # --------------------
 # SEARCH
 # --------------------
 
 
-def autocomplete_response(rows, label_fn, limit=10):
-    return jsonify([
-        {"id": r.id, "label": label_fn(r)}
-        for r in rows[:limit]
-    ])
-
-
-def search_by_name(model, q, label_fn=lambda x: x.name, limit=10):
-    q_norm = normalize(q)
-    if not q_norm:
-        return []
-    with SessionLocal() as s:
-        rows = s.query(model).order_by(model.name).all()
-        results = [
-            r for r in rows
-            if q_norm in normalize(r.name)
-        ][:limit]
-        return [{"id": r.id, "label": label_fn(r)} for r in results]
-
-
-def location_helper_func(loc: Location) -> str:
-    parts = []
-    current = loc
-    while current:
-        parts.append(current.name)
-        current = current.parent
-    return " > ".join(reversed(parts))
+def filter_visible(query): # hide +18 items, query must select Item
+    if is_Yosh_allowed():
+        return query
+    return search.filter_hidden(query)
+
+
+def location_paths(s) -> dict:
+    return dict(s.query(Location.id, Location.path))
+
+
+def etag_cached(view):
+    """
+    GET responses only change when the data version does: the ETag is version + URL + visibility,
+    and a matching If-None-Match is answered with 304 before the view runs
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with ReadSessionLocal() as s:
+            g.data_version = get_data_version(s)
+        key = f"{g.data_version}|{request.full_path}|{is_Yosh_allowed()}|{wants_stream()}"
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            metrics.inc("inventory_etag_responses_total", (("result", "hit"),))
+            response = Response(status=304)
+        else:
+            metrics.inc("inventory_etag_responses_total", (("result", "miss"),))
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return wrapper
+
+
+def update_autocomplete_index(version, change=None):
+    """
+    after a write's commit: change(index) patches this worker's index, then it reflects version.
+    the write is committed whatever happens here, so a failing patch only drops the index
+    """
+    try:
+        if not autocomplete_index.is_current(version - 1):
+            # not built, or another worker wrote since: patching it would mix data versions
+            autocomplete_index.invalidate()
+            return
+        if change is not None:
+            change(autocomplete_index)
+        autocomplete_index.advance(version)
+    except Exception:
+        current_app.logger.exception("autocomplete index patch failed, it will be rebuilt")
+        autocomplete_index.invalidate()
+
+
+def current_autocomplete_index(s):
+    # another worker may have written since this one last patched its index
+    version = g.get("data_version")
+    if version is None:
+        version = get_data_version(s)
+    if not autocomplete_index.is_current(version):
+        metrics.inc("inventory_autocomplete_index_builds_total")
+        autocomplete_index.build(s, location_paths(s), version)
+    return autocomplete_index
+
+
+AUTOCOMPLETE_LIMIT = 10
+
+
+def field_search(key):
+    # every /api/items/<key> route: the field is described in search.SEARCH_FIELDS
+    field = search.SEARCH_FIELDS[key]
+    q = field.prepare(request.args.get("q", ""))
+    allow_hidden = is_Yosh_allowed()
+    bounds = {}
+    if field.match == search.NUMERIC:
+        bounds = {"low": request.args.get("min", type=float), "high": request.args.get("max", type=float)}
+    if is_autocomplete():
+        def compute(limit):
+            with ReadSessionLocal() as s:
+                if field.index:
+                    return current_autocomplete_index(s).search(field.index, q, allow_hidden, limit)
+                return search.autocomplete(s, field, q, allow_hidden, **bounds, limit=limit)
+
+        with timing.phase("filter"):
+            results = autocomplete_cache.get(
+                g.data_version, (key, *bounds.values()), q, allow_hidden, compute,
+                field.narrow if field.prefix_monotone else None)
+        with timing.phase("serialize"):
+            return jsonify(results[:AUTOCOMPLETE_LIMIT])
+    with ReadSessionLocal() as s:
+        query = search.item_query(s, field, q, allow_hidden, **bounds)
+        return items_response(with_item_relations(query))
 
 
 def iso(d):
@@ -126,459 +336,218 @@ def battery_to_dict(b):
         "voltage": b.voltage, "current": b.current, "capacity": b.capacity, "charging_type": b.charging_type, }
 
 
+def with_item_relations(query):
+    # everything item_to_dict reads, loaded in a fixed number of queries whatever the result size
+    return query.options(
+        selectinload(Item.group).selectinload(ItemGroup.tags),
+        selectinload(Item.group).selectinload(ItemGroup.battery),
+        selectinload(Item.location).selectinload(Location.parent),
+    )
+
+
+def serialize_items(items):
+    return [item_to_dict(i) for i in items]
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def paginate(query):
+    # keyset pagination on Item.id: ?limit=&cursor=<last id of the previous page>
+    limit = max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    cursor = request.args.get("cursor", type=int)
+    if cursor is not None:
+        query = query.filter(Item.id > cursor)
+    rows = query.order_by(Item.id).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def page_response(items, next_cursor):
+    # the body stays a plain list, the cursor of the next page is sent as a header
+    response = jsonify(serialize_items(items))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return response
+
+
+STREAM_BATCH_SIZE = 500
+
+
+def wants_stream() -> bool:
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+
+def stream_items(query):
+    # one JSON object per line, rows are fetched and serialized STREAM_BATCH_SIZE at a time
+    cursor = request.args.get("cursor", type=int)
+    if cursor is not None:
+        query = query.filter(Item.id > cursor)
+    query = query.order_by(Item.id)
+    dumps = current_app.json.dumps  # the generator runs after the app context is gone
+    debug = wants_timing_debug()
+    route = timing.current().route
+
+    def generate():
+        # the request's session is closed once the view returns, the stream needs its own
+        # the headers are gone by then too: ?debug=timing sends the stream's timings as a last line
+        token = timing.start(route)
+        try:
+            with ReadSessionLocal() as s, timing.phase("stream"):
+                for i in query.with_session(s).yield_per(STREAM_BATCH_SIZE):
+                    yield dumps(item_to_dict(i)) + "\n"
+            if debug:
+                yield dumps({"timing": timing.current().as_dict()}) + "\n"
+        finally:
+            timing.stop(token)
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def items_response(query):
+    if wants_stream():
+        return stream_items(query)
+    with timing.phase("filter"):
+        items, next_cursor = paginate(query)
+    with timing.phase("serialize"):
+        # with_item_relations' selectinloads ran with the query: statements here are lazy loads
+        return page_response(items, next_cursor)
+
+
 def item_to_dict(i: Item): # this dict is used by the js for editing an item. string is the name in the js
     return {
         "id": i.id, "group": i.group.name, "instruction": i.group.instruction, "battery": battery_to_dict(i.group.battery),
         "tags": [t.name for t in i.group.tags], "last_seen": iso(i.last_seen_date),
         "last_use": iso(i.last_use_date), "acquired": iso(i.acquired_date), "has_cable": i.has_dedicated_cable, "bought_place": i.bought_place, "price": i.price,
-        "color": i.color, "variant": i.variant, "status": i.status, "location": location_helper_func(i.location), "location_id": i.location.id, "location_parent": location_helper_func(i.location.parent), }
+        "color": i.color, "variant": i.variant, "status": i.status, "location": i.location.path, "location_id": i.location_id, "location_parent": i.location.parent.path if i.location.parent else "", }
 
 
-@app.route("/api/items/tag")
+@bp.route("/api/items/tag")
 @auth.login_required
+@etag_cached
 def search_items_by_tag():
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        query = (s.query(Item).join(Item.group).join(
-            tag_association).join(Tag))
-        if not is_Yosh_allowed():
-            query = query.filter(
-                ~ItemGroup.tags.any(Tag.name.ilike("%+18%"))
-            )
-        query = query.all()
-        filtered = [
-            i for i in query
-            if any(q in normalize(t.name) for t in i.group.tags)
-        ]
-        if is_autocomplete():
-            tags = [
-                t for i in filtered for t in i.group.tags if q in normalize(t.name)]
-            return autocomplete(tags, lambda t: t.name)
-        return jsonify([item_to_dict(i) for i in filtered])
-
-
-@app.route("/api/items/location")
+    return field_search("tag")
+
+
+@bp.route("/api/items/location")
 @auth.login_required
+@etag_cached
 def search_items_by_location():
-    q = normalize(request.args.get("q", "").rsplit(">", 1)[-1].strip())
-    with SessionLocal() as s:
-        if is_autocomplete():
-            query = s.query(Location).all()
-            filtered = [i for i in query if q in normalize(location_helper_func(i))]
-            return autocomplete([i for i in filtered], location_helper_func)
-        query = s.query(Item).outerjoin(Item.location)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        filtered = [i for i in query if q in normalize(location_helper_func(i.location))]
-        return jsonify([item_to_dict(i) for i in filtered])
+    return field_search("location")
 
 
-@app.route("/api/items/group")
+@bp.route("/api/items/group")
 @auth.login_required
+@etag_cached
 def search_items_by_group():
-    Yosh_allowed = is_Yosh_allowed()
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        if is_autocomplete():
-            query = s.query(ItemGroup)
-            if not Yosh_allowed:
-                query = query.filter(
-                    ~ItemGroup.tags.any(Tag.name.ilike("%+18%"))
-                )
-            query = query.all()
-            filtered = [i for i in query if q in normalize(i.name)]
-            return autocomplete(
-                [i for i in filtered],
-                lambda g: g.name)
-        query = s.query(Item).join(Item.group)
-        if not Yosh_allowed:
-            query = query.filter(
-                ~ItemGroup.tags.any(Tag.name.ilike("%+18%"))
-            )
-        query = query.all()
-        filtered = [i for i in query if q in normalize(i.group.name)]
-        return jsonify([item_to_dict(i) for i in filtered])
-
-
-def str_match(value, q):
-    return q in str(value)
-
-
-@app.route("/api/items/voltage")
+    return field_search("group")
+
+
+@bp.route("/api/items/voltage")
 @auth.login_required
+@etag_cached
 def search_items_by_voltage():
-    q = request.args.get("q", type=str)
-    with SessionLocal() as s:
-        query = (s.query(Item).join(Item.group).join(ItemGroup.battery).distinct())
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        items = query.all()
-        if is_autocomplete() and q:
-            filtered = [
-                i.group.battery.voltage
-                for i in items
-                if i.group.battery and i.group.battery.voltage is not None and q in str(i.group.battery.voltage)
-            ]
-            exact_matches = [v for v in filtered if str(v) == q]
-            partial_matches = [v for v in filtered if str(v) != q]
-            partial_matches.sort() # sort partial matches alphabetically or numerically
-            result = exact_matches + partial_matches
-            result = list(dict.fromkeys(result)) # deduplicate
-            return jsonify([{"id": v, "label": str(v)} for v in result[:10]])
-        if not q:
-            return jsonify([])
-        seen = {}
-        for i in items:
-            if not i.group.battery:
-                continue
-            v = i.group.battery.voltage
-            if v is None:
-                continue
-            if q in str(v):
-                seen.setdefault(v, i)
-        return jsonify([
-            item_to_dict(i)
-            for i in seen.values()
-        ])
-
-
-
-@app.route("/api/items/current")
+    return field_search("voltage")
+
+
+@bp.route("/api/items/current")
 @auth.login_required
+@etag_cached
 def search_items_by_current():
-    q = request.args.get("q", type=str)
-    with SessionLocal() as s:
-        query = (s.query(Item).join(Item.group).join(ItemGroup.battery).distinct())
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        items = query.all()
-        if is_autocomplete() and q:
-            filtered = [
-                i.group.battery.current
-                for i in items
-                if i.group.battery and i.group.battery.current is not None and q in str(i.group.battery.current)
-            ]
-            exact_matches = [v for v in filtered if str(v) == q]
-            partial_matches = [v for v in filtered if str(v) != q]
-            partial_matches.sort() # sort partial matches alphabetically or numerically
-            result = exact_matches + partial_matches
-            result = list(dict.fromkeys(result)) # deduplicate
-            return jsonify([{"id": v, "label": str(v)} for v in result[:10]])
-        if not q:
-            return jsonify([])
-        seen = {}
-        for i in items:
-            if not i.group.battery:
-                continue
-            v = i.group.battery.current
-            if v is None:
-                continue
-            if q in str(v):
-                seen.setdefault(v, i)
-        return jsonify([
-            item_to_dict(i)
-            for i in seen.values()
-        ])
-
-
-
-@app.route("/api/items/capacity")
+    return field_search("current")
+
+
+@bp.route("/api/items/capacity")
 @auth.login_required
+@etag_cached
 def search_items_by_capacity():
-    q = request.args.get("q", type=str)
-    with SessionLocal() as s:
-        query = (s.query(Item).join(Item.group).join(ItemGroup.battery).distinct())
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        items = query.all()
-        if is_autocomplete() and q:
-            filtered = [
-                i.group.battery.capacity
-                for i in items
-                if i.group.battery and i.group.battery.capacity is not None and q in str(i.group.battery.capacity)
-            ]
-            exact_matches = [v for v in filtered if str(v) == q]
-            partial_matches = [v for v in filtered if str(v) != q]
-            partial_matches.sort() # sort partial matches alphabetically or numerically
-            result = exact_matches + partial_matches
-            result = list(dict.fromkeys(result)) # deduplicate
-            return jsonify([{"id": v, "label": str(v)} for v in result[:10]])
-        if not q:
-            return jsonify([])
-        seen = {}
-        for i in items:
-            if not i.group.battery:
-                continue
-            v = i.group.battery.capacity
-            if v is None:
-                continue
-            if q in str(v):
-                seen.setdefault(v, i)
-        return jsonify([
-            item_to_dict(i)
-            for i in seen.values()
-        ])
-
-
-
-@app.route("/api/items/charging-type")
+    return field_search("capacity")
+
+
+@bp.route("/api/items/charging-type")
 @auth.login_required
+@etag_cached
 def search_items_by_charging_type():
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        query = (s.query(Item).join(Item.group).join(ItemGroup.battery))
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        filtered = [
-            i for i in query
-            if i.group.battery and q in normalize(i.group.battery.charging_type)
-        ]
-        if is_autocomplete():
-            seen = set()
-            unique = []
-            for b in (i.group.battery for i in filtered):
-                ct = b.charging_type
-                if ct not in seen:
-                    seen.add(ct)
-                    unique.append(b)
-
-            return autocomplete(unique, lambda b: b.charging_type)
-
-        return jsonify([item_to_dict(i) for i in filtered])
-
-
-@app.route("/api/items/bought-place")
+    return field_search("charging-type")
+
+
+@bp.route("/api/items/bought-place")
 @auth.login_required
+@etag_cached
 def search_items_by_bought_place():
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        filtered = [
-            i for i in query if i.bought_place and q in normalize(i.bought_place)
-        ]
-
-        if is_autocomplete():
-            seen = set()
-            unique = []
-            for i in filtered:
-                bp = i.bought_place
-                if bp not in seen:
-                    seen.add(bp)
-                    unique.append(i)
-            result = autocomplete(unique, lambda i: i.bought_place)
-            return result
-
-        result = [item_to_dict(i) for i in filtered]
-        return jsonify(result)
-
-
-@app.route("/api/items/variant")
+    return field_search("bought-place")
+
+
+@bp.route("/api/items/variant")
 @auth.login_required
+@etag_cached
 def search_items_by_variant():
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        filtered = [
-            i for i in query if i.variant and q in normalize(i.variant)]
-
-        if is_autocomplete():
-            seen = set()
-            unique = []
-            for i in filtered:
-                col = i.variant
-                if col not in seen:
-                    seen.add(col)
-                    unique.append(i)
-            result = autocomplete(unique, lambda i: i.variant)
-            return result
-        return jsonify([item_to_dict(i) for i in filtered])
-
-@app.route("/api/items/color")
+    return field_search("variant")
+
+
+@bp.route("/api/items/color")
 @auth.login_required
+@etag_cached
 def search_items_by_color():
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        filtered = [
-            i for i in query if i.color and q in normalize(i.color)]
-
-        if is_autocomplete():
-            seen = set()
-            unique = []
-            for i in filtered:
-                col = i.color
-                if col not in seen:
-                    seen.add(col)
-                    unique.append(i)
-            result = autocomplete(unique, lambda i: i.color)
-            return result
-        return jsonify([item_to_dict(i) for i in filtered])
-
-@app.route("/api/items/status")
+    return field_search("color")
+
+
+@bp.route("/api/items/status")
 @auth.login_required
+@etag_cached
 def search_items_by_status():
-    q = normalize(request.args.get("q", ""))
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        filtered = [
-            i for i in query if i.status and q in normalize(i.status)]
-        if is_autocomplete():
-            seen = set()
-            unique = []
-            for i in filtered:
-                col = i.status
-                if col not in seen:
-                    seen.add(col)
-                    unique.append(i)
-            result = autocomplete(unique, lambda i: i.status)
-            return result
-        return jsonify([item_to_dict(i) for i in filtered])
-    
-@app.route("/api/items/price")
+    return field_search("status")
+
+
+@bp.route("/api/items/price")
 @auth.login_required
+@etag_cached
 def search_items_by_price():
-    q = request.args.get("q", "")
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        if is_autocomplete():
-            prices = sorted(
-                {
-                    i.price
-                    for i in query
-                    if i.price is not None and q in str(i.price)
-                }
-            )
-            return jsonify([
-                {"id": p, "label": str(p)}
-                for p in prices[:10]
-            ])
-        return jsonify([item_to_dict(i) for i in query if str(q) in str(i.price)])
-
-
-@app.route("/api/items/last-seen")
+    return field_search("price")
+
+
+@bp.route("/api/items/last-seen")
 @auth.login_required
+@etag_cached
 def search_items_last_seen():
-    q = request.args.get("q")
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        if is_autocomplete():
-            dates = sorted(
-                {
-                    i.last_seen_date
-                    for i in query
-                    if i.last_seen_date and q in i.last_seen_date.isoformat()
-                },
-                reverse=True
-            )
-            return jsonify([
-                {"id": d.isoformat(), "label": d.isoformat()}
-                for d in dates[:10]
-            ])
-        return jsonify([item_to_dict(i) for i in query if q in str(i.last_seen_date)])
-
-
-@app.route("/api/items/last-use")
+    return field_search("last-seen")
+
+
+@bp.route("/api/items/last-use")
 @auth.login_required
+@etag_cached
 def search_items_last_use():
-    q = request.args.get("q")
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        if is_autocomplete():
-            dates = sorted(
-                {
-                    i.last_use_date
-                    for i in query
-                    if i.last_use_date and q in i.last_use_date.isoformat()
-                },
-                reverse=True
-            )
-            return jsonify([
-                {"id": d.isoformat(), "label": d.isoformat()}
-                for d in dates[:10]
-            ])
-        return jsonify([item_to_dict(i) for i in query if q in str(i.last_use_date)])
-
-
-@app.route("/api/items/acquired")
+    return field_search("last-use")
+
+
+@bp.route("/api/items/acquired")
 @auth.login_required
+@etag_cached
 def search_items_acquired():
-    q = request.args.get("q")
-    with SessionLocal() as s:
-        query = s.query(Item).outerjoin(Item.group)
-        if not is_Yosh_allowed():
-            query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%"))))
-        query = query.all()
-        if is_autocomplete():
-            dates = sorted(
-                {
-                    i.acquired_date
-                    for i in query
-                    if i.acquired_date and q in i.acquired_date.isoformat()
-                },
-                reverse=True
-            )
-            return jsonify([
-                {"id": d.isoformat(), "label": d.isoformat()}
-                for d in dates[:10]
-            ])
-        return jsonify([item_to_dict(i) for i in query if q in str(i.acquired_date)])
-
-
-@app.route("/api/items/id")
+    return field_search("acquired")
+
+
+@bp.route("/api/items/id")
 @auth.login_required
+@etag_cached
 def search_item_by_id():
-    q = request.args.get("q", type=int)
-    with SessionLocal() as s:
-        if is_autocomplete():
-            query = s.query(Item.id).order_by(Item.id.desc())
-            if not is_Yosh_allowed():
-                query = query.filter(~Item.group.has(ItemGroup.tags.any(Tag.name.ilike("%+18%")))).limit(10)
-            return jsonify([{"id": i[0], "label": str(i[0])} for i in query])
-        item = s.get(Item, q)
-        return jsonify([item_to_dict(item)]) if item else jsonify([])
+    return field_search("id")
 
 
-@app.route("/api/items/group-id")
+@bp.route("/api/items/group-id")
 @auth.login_required
+@etag_cached
 def search_items_by_group_id():
-    q = request.args.get("q", type=int)
-    with SessionLocal() as s:
-        query = s.query(Item).filter(Item.group_id.ilike(f"%{q}%"))
-        if not is_Yosh_allowed():
-            query = query.filter(
-                ~ItemGroup.tags.any(Tag.name.ilike("%+18%"))
-            )
-        query = query.all()
-        if is_autocomplete():
-            return jsonify([{"id": q, "label": str(q)}])
-        return jsonify([item_to_dict(i) for i in query])
+    return field_search("group-id")
 
 
-@app.route("/api/items")
+@bp.route("/api/items")
 @auth.login_required
+@etag_cached
 def advanced_search():
     price_min = request.args.get("price_min", type=float)
     price_max = request.args.get("price_max", type=float)
@@ -586,13 +555,8 @@ def advanced_search():
     before = request.args.get("before")
     tag_partial = normalize(request.args.get("tag_partial", ""))
 
-    with SessionLocal() as s:
-        q = s.query(Item).join(Item.group).outerjoin(
-            tag_association).outerjoin(Tag)
-        if not is_Yosh_allowed():
-            q = q.filter(
-                ~ItemGroup.tags.any(Tag.name.ilike("%+18%"))
-            )
+    with ReadSessionLocal() as s:
+        q = filter_visible(s.query(Item))
 
         if price_min is not None:
             q = q.filter(Item.price >= price_min)
@@ -607,10 +571,148 @@ def advanced_search():
             q = q.filter(Item.last_seen_date <= before)
 
         if tag_partial:
-            q = q.filter(func.lower(Tag.name).ilike(f"%{tag_partial}%"))
+            q = q.filter(Item.group.has(ItemGroup.tags.any(
+                Tag.name_norm.contains(tag_partial, autoescape=True))))
+
+        q = with_item_relations(q)
+        return items_response(q)
 
-        q = q.distinct().all()
-        return jsonify([item_to_dict(i) for i in q])
+
+@bp.route("/api/search")
+@auth.login_required
+@etag_cached
+def fulltext_search():
+    """
+    every word of q (as a prefix) in the group name, instruction, tags, location, color, variant,
+    status or bought place of an item, best matches first. ?limit= like the paginated searches
+    """
+    q = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    with ReadSessionLocal() as s:
+        if s.get_bind().dialect.name not in FULLTEXT_DIALECTS:
+            return abort(501, "Full-text search needs SQLite or MySQL")
+        with timing.phase("filter"):
+            ids = search.fulltext_ids(s, q, is_Yosh_allowed(), limit)
+            items = with_item_relations(s.query(Item).filter(Item.id.in_(ids))).all() if ids else []
+        with timing.phase("serialize"):
+            by_id = {i.id: i for i in items}
+            return jsonify(serialize_items([by_id[i] for i in ids if i in by_id]))
+
+
+# ?by= -> rollup table, its key, the model it counts and the label shown
+STATS_BY = {
+    "location": (LocationStats, LocationStats.location_id, Location, Location.path),
+    "group": (GroupStats, GroupStats.item_group_id, ItemGroup, ItemGroup.name),
+    "tag": (TagStats, TagStats.tag_id, Tag, Tag.name),
+}
+
+
+def visible_totals(stats, allow_hidden):
+    # item count and price sum columns, less the +18 part unless it is allowed
+    if allow_hidden or not hasattr(stats, "hidden_count"):
+        return stats.item_count, stats.price_sum
+    return stats.item_count - stats.hidden_count, stats.price_sum - stats.hidden_price_sum
+
+
+@bp.route("/api/stats")
+@auth.login_required
+@etag_cached
+def inventory_stats():
+    """
+    item count and price sum read from the rollup tables, never from the items. without ?by= the
+    whole inventory, ?by=location|group|tag each of them (a location counts its sublocations),
+    most items first. ?id= only that one, ?limit= like the paginated searches
+    """
+    by = request.args.get("by")
+    allow_hidden = is_Yosh_allowed()
+    with ReadSessionLocal() as s:
+        if by is None:
+            count, price = visible_totals(LocationStats, allow_hidden)
+            items, value = s.execute(
+                select(func.coalesce(func.sum(count), 0), func.coalesce(func.sum(price), 0))
+                .join(Location, Location.id == LocationStats.location_id)
+                .where(Location.parent_id.is_(None))).one()
+            return jsonify({"items": items, "value": round(value, 2)})
+        if by not in STATS_BY:
+            return abort(400, f"by must be one of {', '.join(STATS_BY)}")
+        stats, key, model, label = STATS_BY[by]
+        count, price = visible_totals(stats, allow_hidden)
+        limit = max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        query = (select(key, label, count, price).join(model, model.id == key)
+                 .where(count > 0).order_by(count.desc(), key).limit(limit))
+        if model is ItemGroup and not allow_hidden:
+            query = query.where(ItemGroup.hidden.is_not(True))
+        if request.args.get("id"):
+            query = query.where(key == request.args.get("id", type=int))
+        return jsonify([{"id": row_id, "name": name, "items": items, "value": round(value, 2)}
+                        for row_id, name, items, value in s.execute(query)])
+
+
+@bp.route("/api/autocomplete-cache")
+@auth.login_required
+def autocomplete_cache_stats():
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    return autocomplete_cache.stats()
+
+
+@bp.route("/api/slow-queries")
+@auth.login_required
+def slow_query_log():
+    # newest first. INVENTORY_SLOW_QUERY_MS sets the threshold
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    return {"threshold_ms": slow_queries.SLOW_QUERY_SECONDS * 1000, "queries": slow_queries.slow_queries.recent()}
+
+
+def pool_metrics():
+    samples = {"checked_out": [], "checked_in": [], "overflow": [], "size": []}
+    for name, e in (("write", engine), ("read", read_engine)):
+        pool = e.pool
+        if not hasattr(pool, "overflow"):  # only QueuePool has these, SQLite in memory doesn't
+            continue
+        labels = (("engine", name),)
+        samples["checked_out"].append((labels, pool.checkedout()))
+        samples["checked_in"].append((labels, pool.checkedin()))
+        samples["overflow"].append((labels, pool.overflow()))
+        samples["size"].append((labels, pool.size()))
+    return [
+        ("inventory_pool_checked_out", "gauge", "Connections in use.", samples["checked_out"]),
+        ("inventory_pool_checked_in", "gauge", "Idle connections in the pool.", samples["checked_in"]),
+        ("inventory_pool_overflow", "gauge",
+         "Connections opened past the pool size (negative: room left before it).", samples["overflow"]),
+        ("inventory_pool_size", "gauge", "Configured pool size.", samples["size"]),
+    ]
+
+
+def cache_metrics():
+    stats = autocomplete_cache.stats()
+    lookups = stats["hits"] + stats["prefix_hits"] + stats["misses"]
+    hit_rate = (stats["hits"] + stats["prefix_hits"]) / lookups if lookups else 0
+    labels = (("cache", "autocomplete"),)
+    return [
+        ("inventory_cache_entries", "gauge", "Entries held by an in-process cache.", [(labels, stats["entries"])]),
+        ("inventory_cache_lookups_total", "counter", "Cache lookups, by result.", [
+            (labels + (("result", "hit"),), stats["hits"]),
+            (labels + (("result", "prefix_hit"),), stats["prefix_hits"]),
+            (labels + (("result", "miss"),), stats["misses"]),
+        ]),
+        ("inventory_cache_hit_ratio", "gauge", "Hits (prefix hits included) over lookups since start.",
+         [(labels, hit_rate)]),
+    ]
+
+
+metrics.collectors += [pool_metrics, cache_metrics]
+
+
+@bp.route("/metrics")
+@auth.login_required
+def prometheus_metrics():
+    # for Prometheus: scrape as Yosh with a bearer token from POST /api/token
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    body = metrics.render()
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 # --------------------
 # HELPERS FOR CREATE FUNCTIONS
@@ -618,7 +720,7 @@ def advanced_search():
 
 
 def parse_date(value: str) -> date | None:
-    if not value:
+    if not value or not isinstance(value, str):
         return None
     # Try YYYY-MM-DD
     try:
@@ -640,18 +742,65 @@ def parse_date(value: str) -> date | None:
 ITEM_FIELDS = {"last_seen_date": parse_date, "last_use_date": parse_date, "has_dedicated_cable": bool, "acquired_date": parse_date, "price": lambda x: x }
 
 
+ITEM_TEXT_FIELDS = ("bought_place", "color", "status", "variant")
+
+
+def item_fields(data) -> dict:
+    fields = {field: cast(data.get(field)) for field, cast in ITEM_FIELDS.items()}
+    for field in ITEM_TEXT_FIELDS:
+        fields[field] = (data.get(field) or "").strip() or None
+    return fields
+
+
+def item_fields_error(data) -> str | None:
+    # item_fields() and the group/location lookups take strings: anything else is refused, not a 500
+    dates = [field for field, cast in ITEM_FIELDS.items() if cast is parse_date]
+    for field in ("group", "location", *ITEM_TEXT_FIELDS, *dates):
+        if data.get(field) is not None and not isinstance(data.get(field), str):
+            return f"{field} must be a string"
+    return None
+
+
 def apply_item_fields(item, data):
-    for field, cast in ITEM_FIELDS.items():
-        setattr(item, field, cast(data.get(field)))
-    item.bought_place = (data.get("bought_place") or "").strip() or None
-    item.color = (data.get("color") or "").strip() or None
-    item.status = (data.get("status") or "").strip() or None
-    item.variant = (data.get("variant") or "").strip() or None
+    for field, value in item_fields(data).items():
+        setattr(item, field, value)
+
+
+BATTERY_FIELDS = ("voltage", "current", "capacity", "charging_type")
+
+
+def battery_fields(data) -> dict:
+    """
+    the battery fields of a group as the columns hold them: numbers as floats, empty values as
+    None, so "5" and 5 are the same battery. raises ValueError naming a field that is neither
+    """
+    fields = {}
+    for field in ("voltage", "current", "capacity"):
+        value = data.get(field)
+        try:
+            fields[field] = float(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number")
+    fields["charging_type"] = data.get("charging_type") or None
+    if not isinstance(fields["charging_type"], (str, type(None))):
+        raise ValueError("charging_type must be a string")
+    return fields
+
 
+def load_batteries(s) -> dict:
+    # the battery table is small: a batch loads it once, keyed by its fields
+    return {tuple(getattr(b, f) for f in BATTERY_FIELDS): b for b in s.query(Battery)}
 
-def get_or_create_battery(s, **fields):
+
+def get_or_create_battery(s, batteries=None, **fields):
     if not any(fields.values()):
         return None
+    if batteries is not None:
+        key = tuple(fields[f] for f in BATTERY_FIELDS)
+        if key not in batteries:
+            batteries[key] = Battery(**fields)
+            s.add(batteries[key])
+        return batteries[key]
     battery = s.query(Battery).filter_by(**fields).one_or_none()
     if battery:
         return battery
@@ -661,26 +810,59 @@ def get_or_create_battery(s, **fields):
     return battery
 
 
-def get_or_create_tags(s, names):
+def load_by_name(s, model, names, *options) -> dict:
+    """
+    normalized name -> row for every row named like one of `names` (case- and accent-insensitive),
+    in one query on the indexed name_norm instead of a lower()/ilike scan. look names up with normalize()
+    """
+    norms = {normalize(name) for name in names if name and name.strip()}
+    if not norms:
+        return {}
+    found = {}
+    for row in s.query(model).options(*options).filter(model.name_norm.in_(norms)):
+        found.setdefault(row.name_norm, row)
+    return found
+
+
+def find_by_name(s, model, names):
+    """
+    name -> row (None when missing) for groups and locations named by a write, one IN query on
+    the indexed name_norm for all of them. an exact (case-insensitive) name wins over an
+    accent-insensitive one
+    """
+    found = {}
+    norms = {normalize(name) for name in names}
+    if norms:
+        for row in s.query(model).filter(model.name_norm.in_(norms)):
+            found.setdefault(row.name_norm, []).append(row)
+
+    def pick(name):
+        candidates = found.get(normalize(name), [])
+        exact = [row for row in candidates if row.name.lower() == name.lower()]
+        return (exact or candidates or [None])[0]
+    return pick
+
+
+def get_or_create_tags(s, names, known=None):
+    # known: from load_by_name(s, Tag, ...), a batch loads it once for all its groups
+    names = [name.strip() for name in names if name and name.strip()]
+    if known is None:
+        known = load_by_name(s, Tag, names)
     tags = []
     for name in names:
-        name = (name or "").strip()
-        if not name:
-            continue
-        tag = (s.query(Tag).filter(func.lower(
-            Tag.name) == name.lower()).one_or_none())
-        if not tag:
-            tag = Tag(name=name)
+        tag = known.get(normalize(name))
+        if tag is None:
+            tag = known[normalize(name)] = Tag(name=name)
             s.add(tag)
-            s.flush()
-        tags.append(tag)
+        if tag not in tags:
+            tags.append(tag)
     return tags
 
 # --------------------
 # DELETE
 # --------------------
 
-@app.route("/api/items", methods=["DELETE"])
+@bp.route("/api/items", methods=["DELETE"])
 @auth.login_required
 def delete_item(): #TODO
     if not am_i_admin():
@@ -692,45 +874,246 @@ def delete_item(): #TODO
         item = s.get(Item, item_id)
         if not item:
             return abort(404, "Item not found")
+        rollup_items(s, [item_id], -1)
         s.delete(item)
+        refresh_fulltext_items(s, [item_id])
+        version = bump_data_version(s)
         s.commit()
+        update_autocomplete_index(version, lambda index: index.remove_item(item_id))
         return {"deleted": True, "id": item_id}, 200
 
+
+@bp.route("/api/items/delete", methods=["POST"])
+@auth.login_required
+def delete_items():
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    ids = batch_ids(request.json or {})
+    if ids is None:
+        return abort(400, "ids must be a list of item ids")
+    with SessionLocal() as s:
+        rollup_items(s, ids, -1)
+        deleted = in_batches(s, delete(Item), ids)
+        refresh_fulltext_items(s, ids)
+        version = bump_data_version(s)
+        s.commit()
+
+    def forget(index):
+        for item_id in ids:
+            index.remove_item(item_id)
+    update_autocomplete_index(version, forget)
+    return {"deleted": deleted}, 200
+
 # --------------------
 # CREATE AND UPDATE
 # --------------------
 
-@app.route("/api/items", methods=["POST"])
+@bp.route("/api/items", methods=["POST"])
 @auth.login_required
 def create_item():
     if not am_i_admin():
         return abort(400, "You're not admin")
     data = request.json or {}
+    error = item_fields_error(data)
+    if error:
+        return abort(400, error)
     group_name = (data.get("group") or "").strip()
     location_name = (data.get("location") or "").strip()
     if not group_name or not location_name:
         return abort(400, "Item Group and Location are required")
     with SessionLocal() as s:
-        group = s.query(ItemGroup).filter(
-            ItemGroup.name.ilike(group_name)).one_or_none()
+        group = find_by_name(s, ItemGroup, [group_name])(group_name)
         if not group:
             return abort(400, f"Item Group '{group_name}' not found")
         location_name = location_name.rsplit(">", 1)[-1].strip()
-        location = s.query(Location).filter(
-            Location.name.ilike(location_name)).one_or_none()
+        location = find_by_name(s, Location, [location_name])(location_name)
         if not location:
             return abort(400, f"Location '{location_name}' not found")
         item = s.get(Item, data.get("id")) if data.get("id") else Item()
         if not item:
             return abort(404, "Item not found")
+        if item.id:
+            rollup_items(s, [item.id], -1)  # counted again below, wherever it goes
         item.group_id = group.id
         item.location_id = location.id
         apply_item_fields(item, data)
         s.add(item)
+        version = bump_data_version(s)  # flushes, so a new item has its id
+        refresh_fulltext_items(s, [item.id])
+        rollup_items(s, [item.id])
+        item_id = item.id
         s.commit()
-        return {"id": item.id}, 200 if data.get("id") else 201
+        update_autocomplete_index(version, lambda index: index.put_item(item))
+        return {"id": item_id}, 200 if data.get("id") else 201
+
+BULK_BATCH_SIZE = 1000
+
 
-@app.route("/api/locations", methods=["POST"])
+def batch_ids(data):
+    # {"ids": [1, 2, 3]} -> sorted unique ids, None when it is not a list of ids
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+        return None
+    return sorted(set(ids))
+
+
+def in_batches(s, statement, ids) -> int:
+    """run an UPDATE/DELETE on Item for `ids`, BULK_BATCH_SIZE ids per IN list. returns the row count"""
+    count = 0
+    for start in range(0, len(ids), BULK_BATCH_SIZE):
+        chunk = ids[start:start + BULK_BATCH_SIZE]
+        result = s.execute(statement.where(Item.id.in_(chunk)),
+                           execution_options={"synchronize_session": False})
+        count += result.rowcount
+    return count
+
+
+@bp.route("/api/items/seen", methods=["POST"])
+@auth.login_required
+def mark_items_seen():
+    """{"ids": [...], "date": "2025-03-14"}: set last_seen_date of every id, date defaults to today"""
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    data = request.json or {}
+    ids = batch_ids(data)
+    if ids is None:
+        return abort(400, "ids must be a list of item ids")
+    seen = parse_date(data.get("date")) if data.get("date") else date.today()
+    if not seen:
+        return abort(400, f"Invalid date '{data.get('date')}'")
+    with SessionLocal() as s:
+        updated = in_batches(s, update(Item).values(last_seen_date=seen), ids)
+        version = bump_data_version(s)
+        s.commit()
+    update_autocomplete_index(version)  # the index has no dates
+    return {"updated": updated, "last_seen_date": seen.isoformat()}, 200
+
+
+@bp.route("/api/items/move", methods=["POST"])
+@auth.login_required
+def move_items():
+    """{"ids": [...], "location": "Maison > Garage"}: move every id to that location"""
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    data = request.json or {}
+    ids = batch_ids(data)
+    if ids is None:
+        return abort(400, "ids must be a list of item ids")
+    location_name = (data.get("location") or "").rsplit(">", 1)[-1].strip()
+    if not location_name:
+        return abort(400, "Location is required")
+    with SessionLocal() as s:
+        location = find_by_name(s, Location, [location_name])(location_name)
+        if not location:
+            return abort(400, f"Location '{location_name}' not found")
+        rollup_items(s, ids, -1)
+        moved = in_batches(s, update(Item).values(location_id=location.id), ids)
+        rollup_items(s, ids)
+        refresh_fulltext_items(s, ids)
+        version = bump_data_version(s)
+        s.commit()
+        update_autocomplete_index(version)  # the index has no item locations
+        return {"moved": moved, "location_id": location.id}, 200
+
+
+def csv_items(text):
+    # cells are strings: empty ones are missing values, the cable flag is spelled out
+    rows = []
+    for row in csv.DictReader(io.StringIO(text)):
+        data = {key.strip(): (value.strip() or None) if isinstance(value, str) else value
+                for key, value in row.items() if key}
+        cable = (data.get("has_dedicated_cable") or "").lower()
+        data["has_dedicated_cable"] = cable in ("1", "true", "yes", "y")
+        rows.append(data)
+    return rows
+
+
+def insert_items(s, rows) -> list:
+    """insert these Item rows, BULK_BATCH_SIZE per statement where the database returns their ids"""
+    if s.get_bind().dialect.insert_executemany_returning:
+        ids = []
+        for start in range(0, len(rows), BULK_BATCH_SIZE):
+            ids += s.scalars(insert(Item).returning(Item.id), rows[start:start + BULK_BATCH_SIZE]).all()
+        return ids
+    # MySQL has no RETURNING: the ORM inserts them one at a time, reading each new id
+    items = [Item(**row) for row in rows]
+    s.add_all(items)
+    s.flush()
+    return [item.id for item in items]
+
+
+@bp.route("/api/items/bulk", methods=["POST"])
+@auth.login_required
+def bulk_create_items():
+    """
+    create many items in one transaction: a JSON array of items like POST /api/items takes,
+    or a CSV (Content-Type: text/csv) with the same names as header. rows with an error
+    are reported by position (1 = first item) and skipped, the others are still created.
+    """
+    if not am_i_admin():
+        return abort(400, "You're not admin")
+    if request.mimetype == "text/csv":
+        data = csv_items(request.get_data(as_text=True))
+    else:
+        data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return abort(400, "Send a JSON array of items or a text/csv body")
+
+    errors = []
+    wanted = []  # (position, item, group name, location name)
+    for position, entry in enumerate(data, start=1):
+        if not isinstance(entry, dict):
+            errors.append({"row": position, "error": "Not an item"})
+            continue
+        error = item_fields_error(entry)
+        if error:
+            errors.append({"row": position, "error": error})
+            continue
+        group_name = (entry.get("group") or "").strip()
+        location_name = (entry.get("location") or "").rsplit(">", 1)[-1].strip()
+        if not group_name or not location_name:
+            errors.append({"row": position, "error": "Item Group and Location are required"})
+            continue
+        if entry.get("id"):
+            errors.append({"row": position, "error": "Bulk import only creates items, use POST /api/items to edit"})
+            continue
+        try:
+            price = entry.get("price")
+            entry = {**entry, "price": float(price) if price not in (None, "") else None}
+        except (TypeError, ValueError):
+            errors.append({"row": position, "error": f"Invalid price '{price}'"})
+            continue
+        wanted.append((position, item_fields(entry), group_name, location_name))
+
+    with SessionLocal() as s:
+        # every referenced group and location in one IN query each
+        group = find_by_name(s, ItemGroup, [w[2] for w in wanted])
+        location = find_by_name(s, Location, [w[3] for w in wanted])
+
+        rows = []
+        for position, fields, group_name, location_name in wanted:
+            item_group, item_location = group(group_name), location(location_name)
+            if not item_group:
+                errors.append({"row": position, "error": f"Item Group '{group_name}' not found"})
+            elif not item_location:
+                errors.append({"row": position, "error": f"Location '{location_name}' not found"})
+            else:
+                fields.update(group_id=item_group.id, location_id=item_location.id)
+                rows.append(with_normalized_columns(Item, fields))
+
+        if rows:
+            ids = insert_items(s, rows)
+            refresh_fulltext_items(s, ids)
+            rollup_items(s, ids)
+            # not advancing the autocomplete index: it is rebuilt on its next use
+            bump_data_version(s)
+            s.commit()
+
+    errors.sort(key=lambda e: e["row"])
+    return {"created": len(rows), "errors": errors}, 201 if rows else 400
+
+
+@bp.route("/api/locations", methods=["POST"])
 @auth.login_required
 def create_location():
     if not am_i_admin():
@@ -765,10 +1148,20 @@ def create_location():
             new_parent_id = parent.id if parent else None
             
             if existing.parent_id != new_parent_id:
-                existing.parent_id = new_parent_id
+                if parent and (parent.id == existing.id or existing.is_ancestor_of(parent)):
+                    return abort(400, f"'{parent.name}' is inside '{existing.name}'")
+                old_parent_id, existing.parent_id = existing.parent_id, new_parent_id
+                # returning without a commit rolls the move back
+                if refresh_location_paths(s, existing) > LOCATION_PATH_LENGTH:
+                    return abort(400, f"A location path would be longer than {LOCATION_PATH_LENGTH} characters")
+                rollup_moved_location(s, existing, old_parent_id)
+                refresh_fulltext(s, Item.location_id.in_(location_subtree(existing)))
+                version = bump_data_version(s)
+                response = {"id": existing.id, "name": existing.name}
                 s.commit()
+                update_autocomplete_index(version, lambda index: index.set_locations(location_paths(s)))
                 # Return 200 to JS, meaning "OK, existing item updated"
-                return {"id": existing.id, "name": existing.name}, 202
+                return response, 202
             
             # Return 200, nothing changed
             return {"id": existing.id, "name": existing.name}, 200
@@ -776,19 +1169,24 @@ def create_location():
         # 4. If it does not exist, create it
         loc = Location(name=name, parent=parent)
         s.add(loc)
+        if refresh_location_paths(s, loc) > LOCATION_PATH_LENGTH:
+            return abort(400, f"A location path would be longer than {LOCATION_PATH_LENGTH} characters")
+        version = bump_data_version(s)  # flushes, so loc has its id
+        response = {"id": loc.id, "name": loc.name}
         s.commit()
+        update_autocomplete_index(version, lambda index: index.set_locations(location_paths(s)))
 
-        return {"id": loc.id, "name": loc.name}, 201
+        return response, 201
 
 
-@app.route("/api/locations/<int:location_id>", methods=["PUT"])
+@bp.route("/api/locations/<int:location_id>", methods=["PUT"])
 @auth.login_required
 def update_location(location_id):
     if not am_i_admin():
         return abort(400, "You're not admin")
 
     data = request.json or {}
-    new_name = (data.get("name") or "").strip()
+    new_name = (data.get("name") or "").rsplit(">", 1)[-1].strip()
 
     if not new_name:
         return abort(400, "New name cannot be empty")
@@ -808,68 +1206,158 @@ def update_location(location_id):
         if existing:
             return abort(400, "A location with this name already exists")
 
-        # 3. Update the name
+        # 3. Update the name, and the path of every location below it
         loc.name = new_name
+        if refresh_location_paths(s, loc) > LOCATION_PATH_LENGTH:
+            return abort(400, f"A location path would be longer than {LOCATION_PATH_LENGTH} characters")
+        refresh_fulltext(s, Item.location_id.in_(location_subtree(loc)))
+        version = bump_data_version(s)
+        response = {"id": loc.id, "name": loc.name}
         s.commit()
+        update_autocomplete_index(version, lambda index: index.set_locations(location_paths(s)))
         
-        return {"id": loc.id, "name": loc.name}, 200
+        return response, 200
+
+
+def item_group_error(data) -> str | None:
+    # a string as tags would be iterated into one tag per character
+    name, tags = data.get("name"), data.get("tags")
+    if not isinstance(name, str) or not name.strip():
+        return "Item group name is required"
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(t, str) for t in tags)):
+        return "tags must be a list of tag names"
+    try:
+        battery_fields(data)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def upsert_item_group(s, data, groups, tags=None, batteries=None, states=None):
+    """
+    create or update the group named data["name"]. groups: normalized name -> ItemGroup
+    from load_by_name(), tags and batteries: see get_or_create_tags() and load_batteries().
+    states: group id -> group_state() before the first edit, for rollup_regrouped()
+    """
+    name = data["name"].strip()
+
+    # Try to get an existing group by name
+    item_group = groups.get(normalize(name))
+
+    # If an ID was provided and it's different from the one found by name, fetch by ID
+    group_id = data.get("id")
+    if group_id:
+        id_group = s.get(ItemGroup, group_id)
+        if id_group and id_group != item_group:
+            # Prefer the ID group (so edits by ID are respected)
+            item_group = id_group
+
+    # If no group exists at all, create a new one
+    if not item_group:
+        item_group = ItemGroup()
+        s.add(item_group)
+    elif states is not None and item_group.id not in states:
+        states[item_group.id] = group_state(item_group)
 
+    # Update all fields
+    item_group.name = name
+    item_group.instruction = data.get("instruction")
+    groups[normalize(name)] = item_group
 
-@app.route("/api/item-group", methods=["POST"])
+    # Battery
+    item_group.battery = get_or_create_battery(s, batteries, **battery_fields(data))
+
+    # Tags
+    item_group.tags = get_or_create_tags(s, data.get("tags") or [], tags)
+    item_group.refresh_hidden()
+    return item_group
+
+
+@bp.route("/api/item-group", methods=["POST"])
 @auth.login_required
 def create_or_update_item_group():
     if not am_i_admin():
         return abort(400, "You're not admin")
 
     data = request.json or {}
-    name = (data.get("name") or "").strip()
-    if not name:
-        return abort(400, "Item group name is required")
+    if isinstance(data, list):
+        return upsert_item_groups(data)
+    error = item_group_error(data)
+    if error:
+        return abort(400, error)
+    name = data["name"].strip()
 
     with SessionLocal() as s:
+        states = {}
+        item_group = upsert_item_group(s, data, load_by_name(s, ItemGroup, [name]), states=states)
 
-        # Try to get an existing group by name
-        item_group = s.query(ItemGroup).filter(ItemGroup.name.ilike(name)).first()
-
-        # If an ID was provided and it's different from the one found by name, fetch by ID
-        group_id = data.get("id")
-        if group_id:
-            id_group = s.get(ItemGroup, group_id)
-            if id_group and id_group != item_group:
-                # Prefer the ID group (so edits by ID are respected)
-                item_group = id_group
-
-        # If no group exists at all, create a new one
-        if not item_group:
-            item_group = ItemGroup()
-            s.add(item_group)
-
-        # Update all fields
-        item_group.name = name
-        item_group.instruction = data.get("instruction")
-
-        # Battery
-        battery = get_or_create_battery(
-            s,
-            voltage=data.get("voltage"),
-            current=data.get("current"),
-            capacity=data.get("capacity"),
-            charging_type=data.get("charging_type"),
-        )
-        item_group.battery = battery
-
-        # Tags
-        tags = get_or_create_tags(s, data.get("tags", []))
-        item_group.tags = tags
-
+        version = bump_data_version(s)
+        refresh_fulltext(s, Item.group_id == item_group.id)  # name, instruction, tags, visibility
+        rollup_regrouped(s, states)
+        group_id = item_group.id
         s.commit()
+        update_autocomplete_index(version, lambda index: index.put_group(item_group))
 
         return {
-            "id": item_group.id,
+            "id": group_id,
             "updated": True,
         }, 200
 
 
+def upsert_item_groups(entries):
+    # batch mode of /api/item-group: every group, tag and battery is looked up once, one commit
+    errors = []
+    valid = []
+    for position, entry in enumerate(entries, start=1):
+        error = item_group_error(entry) if isinstance(entry, dict) else "Item group name is required"
+        if error:
+            errors.append({"row": position, "error": error})
+        else:
+            valid.append(entry)
+
+    with SessionLocal() as s:
+        # current tags are loaded too, replacing them would load them one group at a time
+        groups = load_by_name(s, ItemGroup, [e["name"] for e in valid], selectinload(ItemGroup.tags))
+        ids = {e["id"] for e in valid if e.get("id")}
+        if ids:
+            # so s.get() finds them loaded
+            s.query(ItemGroup).options(selectinload(ItemGroup.tags)).filter(ItemGroup.id.in_(ids)).all()
+        tags = load_by_name(s, Tag, [t for e in valid for t in e.get("tags") or []])
+        batteries = load_batteries(s)
+
+        upserted = []
+        states = {}
+        for entry in valid:
+            item_group = upsert_item_group(s, entry, groups, tags, batteries, states)
+            if item_group not in upserted:
+                upserted.append(item_group)
+
+        upserted_rows = []
+        if upserted:
+            version = bump_data_version(s)  # flushes, so new groups have their id
+            ids = [g.id for g in upserted]
+            refresh_fulltext(s, Item.group_id.in_(ids))
+            rollup_regrouped(s, states)
+            upserted_rows = [{"id": g.id, "name": g.name} for g in upserted]
+            s.commit()
+
+            def put_groups(index):
+                # the commit expired them: reload in one go before the index reads them
+                s.query(ItemGroup).options(selectinload(ItemGroup.tags), selectinload(ItemGroup.battery)) \
+                    .filter(ItemGroup.id.in_(ids)).all()
+                for item_group in upserted:
+                    index.put_group(item_group)
+            update_autocomplete_index(version, put_groups)
+
+        return {
+            "groups": upserted_rows,
+            "errors": errors,
+        }, 200 if upserted or not errors else 400
+
+
+_import_time = time.perf_counter() - _import_started
+
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # development server, see gunicorn.conf.py for production
+    create_app().run(debug=True)
@@ -0,0 +1,296 @@
+"""
+local benchmark: builds a synthetic SQLite inventory, then times every /api/items route
+in-process (Flask test client, no network), with and without autocomplete.
+
+    python bench.py --items 100000                      # report
+    python bench.py --items 100000 --save baseline.json
+    python bench.py --items 100000 --baseline baseline.json   # exits 1 on regressions
+
+the generated database is kept in bench_data/ and reused by the next run at the same scale.
+the report is also written to bench_output.txt
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+BATCH = 10_000
+
+WORDS = ["Maison", "Garage", "Bureau", "Cave", "Grenier", "Étagère", "Boîte", "Tiroir", "Armoire", "Carton",
+         "Câble", "Manette", "Console", "Lampe", "Écran", "Clé", "Sac", "Chargeur", "Batterie", "Outil"]
+COLORS = ["Rouge", "Noir", "Blanc", "Bleu", "Vert", "Jaune", "Rose", "Gris", "Orange", "Violet",
+          "Bleu ciel", "Vert pâle", "Bordeaux", "Doré", "Argenté", "Marron", "Beige", "Turquoise"]
+STATUSES = ["ok", "broken", "lent", "lost", "to repair"]
+CHARGING_TYPES = ["USB-C", "Micro-USB", "Lightning", "None", "Barrel", "Qi"]
+VOLTAGES = [1.2, 1.5, 3.7, 5, 7.4, 9, 12]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", default="1k", help="1k, 100k, 1m or a number")
+    parser.add_argument("--locations", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=6, help="depth of the location tree")
+    parser.add_argument("--tags", type=int, default=500)
+    parser.add_argument("--batteries", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--cache", action="store_true", help="keep the autocomplete cache between requests")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--save", help="write the results as a baseline JSON file")
+    parser.add_argument("--baseline", help="compare with a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p50 slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+    args.items = SCALES.get(args.items.lower()) or int(args.items)
+    return args
+
+
+# --------------------
+# SYNTHETIC DATA
+# --------------------
+
+def generate(args, engine, SessionLocal):
+    from sqlalchemy import insert
+    from models import (Battery, Item, ItemGroup, Location, Tag, tag_association, HIDDEN_TAG,
+                        init_db, refresh_location_paths, with_normalized_columns, backfill_fulltext,
+                        rebuild_rollups)
+    rnd = random.Random(args.seed)
+    init_db(engine, SessionLocal, force=True)
+
+    def insert_rows(conn, model, rows):
+        table = model.__table__ if hasattr(model, "__table__") else model
+        for start in range(0, len(rows), BATCH):
+            conn.execute(insert(table), rows[start:start + BATCH])
+
+    with engine.begin() as conn:
+        # a tree of depth args.depth: each location hangs below one of the previous level
+        locations, level = [], [None]
+        per_level = max(1, args.locations // args.depth)
+        for depth in range(args.depth):
+            current = []
+            for _ in range(per_level):
+                loc_id = len(locations) + 1
+                locations.append(with_normalized_columns(Location, {
+                    "id": loc_id, "name": f"{rnd.choice(WORDS)} {loc_id}", "parent_id": rnd.choice(level)}))
+                current.append(loc_id)
+            level = current
+        insert_rows(conn, Location, locations)
+
+        tags = [with_normalized_columns(Tag, {"id": i + 1, "name": f"{rnd.choice(WORDS)}{i}"})
+                for i in range(args.tags)]
+        tags[0]["name"] = tags[0]["name_norm"] = HIDDEN_TAG
+        insert_rows(conn, Tag, tags)
+
+        batteries = [with_normalized_columns(Battery, {
+            "id": i + 1, "voltage": rnd.choice(VOLTAGES), "current": round(rnd.uniform(0.1, 3), 1),
+            "capacity": rnd.randrange(100, 20000, 50), "charging_type": rnd.choice(CHARGING_TYPES)})
+            for i in range(args.batteries)]
+        insert_rows(conn, Battery, batteries)
+
+        groups, links = [], []
+        for i in range(max(10, args.items // 20)):
+            group_tags = rnd.sample(range(1, args.tags + 1), rnd.randint(1, 4))
+            groups.append(with_normalized_columns(ItemGroup, {
+                "id": i + 1, "name": f"{rnd.choice(WORDS)} {rnd.choice(COLORS)} {i}",
+                "battery_id": rnd.choice([None, rnd.randint(1, args.batteries)]),
+                "hidden": 1 in group_tags}))
+            links.extend({"tag_id": t, "item_group_id": i + 1} for t in group_tags)
+        insert_rows(conn, ItemGroup, groups)
+        insert_rows(conn, tag_association, links)
+
+        def some_date():
+            if rnd.random() < 0.3:
+                return None
+            return datetime.date(2015, 1, 1) + datetime.timedelta(days=rnd.randrange(4000))
+
+        places = [f"{rnd.choice(WORDS)} shop {i}" for i in range(50)]
+        for start in range(0, args.items, BATCH):  # one batch in memory at a time
+            insert_rows(conn, Item, [with_normalized_columns(Item, {
+                "group_id": rnd.randint(1, len(groups)), "location_id": rnd.randint(1, len(locations)),
+                "color": rnd.choice(COLORS), "variant": f"v{rnd.randrange(args.items // 5 + 1)}",
+                "status": rnd.choice(STATUSES), "bought_place": rnd.choice(places),
+                "price": round(rnd.uniform(1, 500), 2), "has_dedicated_cable": rnd.random() < 0.5,
+                "last_seen_date": some_date(), "last_use_date": some_date(), "acquired_date": some_date()})
+                for _ in range(min(BATCH, args.items - start))])
+
+    with SessionLocal() as s:
+        refresh_location_paths(s)
+        s.commit()
+        backfill_fulltext(s)  # the rows above skipped the write handlers that keep item_fts
+        rebuild_rollups(s)  # and the /api/stats rollups
+
+
+# --------------------
+# ENDPOINTS
+# --------------------
+
+def endpoints(rnd, SessionLocal):
+    """(name, path, list of query strings) for every route, queries drawn from the data"""
+    from models import Item, ItemGroup, Location, Tag
+
+    def sample(column, n=20):
+        # seeded, so every run with the same --seed sends the same queries
+        with SessionLocal() as s:
+            values = [v for (v,) in s.query(column).filter(column.is_not(None))
+                      .distinct().order_by(column).limit(2000)]
+        return rnd.sample(values, min(n, len(values))) or [""]
+
+    def prefixes(values, length):
+        return [str(v)[:length] for v in values]
+
+    ids = sample(Item.id)
+    fields = {
+        "tag": prefixes(sample(Tag.name), 3),
+        "location": [str(v).rsplit(" > ", 1)[-1][:4] for v in sample(Location.path)],
+        "group": prefixes(sample(ItemGroup.name), 4),
+        "voltage": [str(v) for v in VOLTAGES],
+        "current": ["1", "0.5", "2.3"],
+        "capacity": ["1", "13", "2000"],
+        "charging-type": ["usb", "c", "light"],
+        "bought-place": ["shop", "ca", "1"],
+        "variant": prefixes(sample(Item.variant), 3),
+        "color": [c[:2].lower() for c in COLORS],
+        "status": ["o", "bro", "lo"],
+        "price": ["9", "42", "120.5"],
+        "last-seen": ["2025", "2019-0", "2021-03-1"],
+        "last-use": ["2024", "2016-1"],
+        "acquired": ["2020", "2018-06"],
+        "id": [str(i) for i in ids],
+        "group-id": [str(rnd.randint(1, 50)) for _ in range(10)],
+    }
+    routes = []
+    for key, queries in fields.items():
+        path = f"/api/items/{key}"
+        routes.append((key, path, [f"q={q}" for q in queries]))
+        routes.append((f"{key} autocomplete", path, [f"q={q}&autocomplete=1" for q in queries]))
+    routes.append(("search", "/api/search", [f"q={q}" for q in
+                                             fields["group"][:5] + fields["tag"][:5] + ["shop", "red"]]))
+    routes.append(("stats", "/api/stats", ["", "by=location", "by=group", "by=tag", "by=location&id=1"]))
+    routes.append(("advanced", "/api/items", ["price_min=10&price_max=100", "tag_partial=ca",
+                                              "after=2020-01-01&before=2021-01-01", ""]))
+    return routes
+
+
+# --------------------
+# MEASURING
+# --------------------
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(args, app, headers, routes):
+    from sqlalchemy import event
+    from db import engine, read_engine
+    import app as appmod
+
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    for e in (engine, read_engine):
+        event.listen(e, "before_cursor_execute", count)
+    client = app.test_client()
+    results = {}
+    for name, path, queries in routes:
+        for i in range(args.warmup):
+            client.get(f"{path}?{queries[i % len(queries)]}", headers=headers)
+        timings, statements[0] = [], 0
+        started = time.perf_counter()
+        for i in range(args.requests):
+            if not args.cache:
+                appmod.autocomplete_cache.clear()
+            t = time.perf_counter()
+            response = client.get(f"{path}?{queries[i % len(queries)]}", headers=headers)
+            response.get_data()
+            timings.append(time.perf_counter() - t)
+            if response.status_code != 200:
+                sys.exit(f"{name}: {path}?{queries[i % len(queries)]} answered {response.status_code}")
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            "p50_ms": percentile(timings, 50) * 1000,
+            "p95_ms": percentile(timings, 95) * 1000,
+            "p99_ms": percentile(timings, 99) * 1000,
+            "rps": args.requests / elapsed,
+            "statements": statements[0] / args.requests,
+        }
+    return results
+
+
+def report(results, baseline, tolerance):
+    lines = [f"{'endpoint':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'stmts':>7}"]
+    regressions = []
+    for name, r in results.items():
+        line = f"{name:<26}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['rps']:>9.0f}{r['statements']:>7.1f}"
+        old = baseline.get(name)
+        if old:
+            # p50: the tail of a few dozen requests is too noisy to gate on
+            change = r["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0
+            line += f"   p50 {change:+.0%}"
+            if change > tolerance:
+                regressions.append(f"{name}: p50 {old['p50_ms']:.2f} -> {r['p50_ms']:.2f} ms")
+            if r["statements"] > old["statements"]:
+                line += f", stmts {old['statements']:.1f} -> {r['statements']:.1f}"
+                regressions.append(f"{name}: {old['statements']:.1f} -> {r['statements']:.1f} statements")
+        lines.append(line)
+    if regressions:
+        lines += ["", "REGRESSIONS:"] + [f"  {r}" for r in regressions]
+    return "\n".join(lines), regressions
+
+
+def main():
+    args = parse_args()
+    os.makedirs("bench_data", exist_ok=True)
+    path = os.path.abspath(f"bench_data/inventory-{args.items}-{args.seed}.db")
+    fresh = args.regenerate or not os.path.exists(path)
+    if fresh:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    # db.py reads these when it is first imported
+    os.environ["INVENTORY_DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.pop("INVENTORY_READ_DATABASE_URL", None)
+
+    import tokens
+    from db import engine, SessionLocal
+    import app as appmod
+
+    if fresh:
+        started = time.perf_counter()
+        generate(args, engine, SessionLocal)
+        print(f"generated {args.items} items in {time.perf_counter() - started:.1f}s -> {path}")
+
+    app = appmod.create_app(warm=True)
+    # a bearer token instead of digest auth: one request per measurement, no 401 challenge
+    appmod.users.update({"Yosh": "bench", "server": "bench"})
+    app.config.update(SECRET_KEY="bench", TOKEN_AUTH=True)
+    headers = {"Authorization": "Bearer " + tokens.sign("bench", "Yosh", "bench"), "X-Yosh": "true"}
+
+    routes = endpoints(random.Random(args.seed), SessionLocal)
+    results = run(args, app, headers, routes)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    text, regressions = report(results, baseline, args.tolerance)
+    header = f"{args.items} items, {args.requests} requests per endpoint, cache {'on' if args.cache else 'off'}"
+    print(header)
+    print(text)
+    with open("bench_output.txt", "w", encoding="utf-8") as file:
+        file.write(header + "\n" + text + "\n")
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"items": args.items, "requests": args.requests, "results": results}, file, indent=2)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+class AutocompleteCache:
+    """
+    LRU of autocomplete answers keyed by (field, q, visibility), emptied when the data version moves forward.
+    an entry keeps up to `candidates` results: when that is all of them, a longer q typed after it
+    is answered by filtering the entry instead of searching again.
+    """
+
+    def __init__(self, size=1024, candidates=200):
+        self.size = size
+        self.candidates = candidates
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (field, q, allow_hidden) -> (results, complete)
+        self.version = None
+        self.hits = self.prefix_hits = self.misses = 0
+
+    def get(self, version, field, q, allow_hidden, compute, narrow=None):
+        """
+        compute(limit) runs the real search. narrow(results, q) filters the complete results
+        of a shorter prefix of q, only pass it when the field's matches shrink as q grows
+        """
+        with self.lock:
+            if self.version is None or version > self.version:
+                self.entries.clear()
+                self.version = version
+            # an older version (a lagging replica, a request that started before a write) is
+            # searched without dropping the newer entries, and not cached
+            if version == self.version:
+                entry = self._get((field, q, allow_hidden))
+                if entry:
+                    self.hits += 1
+                    return entry[0]
+                if narrow:
+                    for n in range(len(q) - 1, -1, -1):
+                        entry = self._get((field, q[:n], allow_hidden))
+                        if entry and entry[1]:
+                            self.prefix_hits += 1
+                            results = narrow(entry[0], q)
+                            self._put((field, q, allow_hidden), (results, True))
+                            return results
+            self.misses += 1
+        results = compute(self.candidates)
+        with self.lock:
+            if version == self.version:
+                self._put((field, q, allow_hidden), (results, len(results) < self.candidates))
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "prefix_hits": self.prefix_hits,
+                "misses": self.misses,
+            }
+
+    # ---- lock must be held ----
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
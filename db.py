@@ -1,14 +1,78 @@
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 
-engine = create_engine(
-    "mysql+pymysql://root:@localhost/inventory", # this is upmost security
-    future=True,
-    echo=False,
-    pool_pre_ping=True, # run SELECT 1
-    pool_recycle=3600 # establish new connection every hour
+import slow_queries
+import timing
+from metrics import metrics, CHECKOUT_BUCKETS
+
+DATABASE_URL = os.environ.get(
+    "INVENTORY_DATABASE_URL", "mysql+pymysql://root:@localhost/inventory") # this is upmost security
+# GET routes read through this one: a MySQL replica, or the same database with its own pool
+READ_DATABASE_URL = os.environ.get("INVENTORY_READ_DATABASE_URL", DATABASE_URL)
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers no longer wait for a writer
+    "PRAGMA synchronous=NORMAL",  # safe with WAL, only the last commits can be lost on power loss
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",  # 64 MB
 )
 
+
+def timed_pool_class(url, name):
+    """
+    the pool the dialect would use, timing each checkout for /metrics: waiting for a free
+    connection, opening a new one and the pre-ping. dispose() builds the new pool from the same class
+    """
+    url = make_url(url)
+    base = url.get_dialect().get_pool_class(url)
+    labels = (("engine", name),)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return base.connect(self)
+        except exc.TimeoutError:
+            metrics.inc("inventory_pool_timeouts_total", labels)
+            raise
+        finally:
+            metrics.observe("inventory_pool_checkout_seconds", labels,
+                            time.perf_counter() - started, CHECKOUT_BUCKETS)
+
+    return type(f"Timed{base.__name__}", (base,), {"connect": connect})
+
+
+def make_engine(url, read_only=False):
+    # SQLite does its work while rows are fetched: its cursors time that too (see timing.py)
+    sqlite = make_url(url).get_driver_name() == "pysqlite"
+    engine = create_engine(
+        url,
+        future=True,
+        poolclass=timed_pool_class(url, "read" if read_only else "write"),
+        connect_args={"factory": timing.SQLiteConnection} if sqlite else {},
+        echo=False,
+        pool_pre_ping=True, # run SELECT 1
+        pool_recycle=3600 # establish new connection every hour
+    )
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+    # statement counts and time for the Server-Timing header, and the slow query log
+    timing.instrument(engine, slow_queries.record)
+    return engine
+
+
+engine = make_engine(DATABASE_URL)
+read_engine = make_engine(READ_DATABASE_URL, read_only=True)
+
 """
 
 sqlite:///inventory.db # SQLite example
@@ -25,3 +89,4 @@ mysql+mysqldb://inventory:@localhost/inventory  # MySQL / MariaDB example
 """
 
 SessionLocal = sessionmaker(bind=engine)
+ReadSessionLocal = sessionmaker(bind=read_engine)
@@ -0,0 +1,45 @@
+# production entry point: gunicorn -c gunicorn.conf.py
+# (gunicorn does not run on Windows, use python app.py there)
+import glob
+import multiprocessing
+import os
+import tempfile
+
+wsgi_app = "app:create_app(warm=True)"
+bind = os.environ.get("INVENTORY_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("INVENTORY_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("INVENTORY_THREADS", 4))
+timeout = int(os.environ.get("INVENTORY_TIMEOUT", 60))
+
+# /metrics: every worker counts the requests it answers and writes them to a file here, a scrape
+# (answered by any worker) adds up the files. one directory per server, emptied when it starts
+os.environ.setdefault("INVENTORY_METRICS_DIR", os.path.join(
+    tempfile.gettempdir(), "inventory-metrics-" + bind.replace(":", "-")))
+
+# create_app() runs once in the master: workers are forked from it and share the
+# autocomplete index and the loaded modules copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    # connections opened while preloading belong to the master, a worker opens its own
+    from db import engine, read_engine
+    from metrics import metrics
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+    metrics.directory = os.environ["INVENTORY_METRICS_DIR"]
+
+
+def on_starting(server):
+    # the master answers no requests: it writes no file. counts of the previous run would be
+    # added to this one's
+    from metrics import metrics
+    metrics.directory = None
+    for path in glob.glob(os.path.join(os.environ["INVENTORY_METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def worker_exit(server, worker):
+    # its counts go to the retired file, so the totals don't go down when its own file is removed
+    from metrics import metrics
+    metrics.retire()
@@ -0,0 +1,277 @@
+"""
+in-memory counters and histograms for /metrics, rendered in the Prometheus text format.
+one lock, held for a few additions per request. every process counts its own requests: with
+INVENTORY_METRICS_DIR set (gunicorn.conf.py does), each one also writes them to a file there
+every FLUSH_SECONDS, and /metrics adds up the files of every worker. an exiting worker adds its
+counts to the directory's retired file and removes its own
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+METRICS_DIR = os.environ.get("INVENTORY_METRICS_DIR")
+FLUSH_SECONDS = 1.0
+RETIRED_FILE = "retired.json"  # in METRICS_DIR, the sums of the workers that exited
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)  # bytes
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)  # seconds
+
+# name -> (type, help), in the order they are rendered
+DESCRIPTIONS = {
+    "inventory_requests_total": ("counter", "Requests handled, by route, method and status."),
+    "inventory_request_duration_seconds": ("histogram", "Time to build the response, streamed bodies excluded."),
+    "inventory_response_size_bytes": ("histogram", "Response body size, streamed bodies excluded."),
+    "inventory_etag_responses_total": ("counter", "Search responses answered with 304 (hit) or a body (miss)."),
+    "inventory_autocomplete_index_builds_total": ("counter", "Rebuilds of the in-memory autocomplete index."),
+    "inventory_pool_checkout_seconds": ("histogram", "Time to get a pooled connection, waiting for a free one included."),
+    "inventory_pool_timeouts_total": ("counter", "Checkouts that gave up waiting for a free connection."),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield f"{name}_bucket{format_labels(labels + (('le', bound),))} {total}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum}"
+        yield f"{name}_count{format_labels(labels)} {total}"
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.collectors = []  # () -> [(name, type, help, [(labels, value)])] read at scrape time
+        self.reset()
+
+    def reset(self):
+        # also in a forked worker: it starts from zero, the parent's counts are the parent's
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()  # held while writing or retiring this process' file
+        self.counters = defaultdict(lambda: defaultdict(int))  # name -> labels -> value
+        self.histograms = defaultdict(dict)  # name -> labels -> Histogram
+        self.path = None  # this process' file in directory, and the thread writing it
+        self.flusher = None
+
+    def inc(self, name, labels=(), amount=1):
+        with self.lock:
+            self._start_flusher()
+            self.counters[name][labels] += amount
+
+    def observe(self, name, labels, value, buckets):
+        with self.lock:
+            self._start_flusher()
+            self._observe(name, labels, value, buckets)
+
+    def observe_request(self, route, method, status, seconds, size=None):
+        labels = (("route", route), ("method", method))
+        with self.lock:
+            self._start_flusher()
+            self.counters["inventory_requests_total"][labels + (("status", status),)] += 1
+            self._observe("inventory_request_duration_seconds", labels, seconds, LATENCY_BUCKETS)
+            if size is not None:
+                self._observe("inventory_response_size_bytes", labels, size, SIZE_BUCKETS)
+
+    def _observe(self, name, labels, value, buckets):
+        # lock must be held
+        histogram = self.histograms[name].get(labels)
+        if histogram is None:
+            histogram = self.histograms[name][labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def _start_flusher(self):
+        # lock must be held
+        if self.directory and self.flusher is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+            self.flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            self.flush()
+
+    def snapshot(self) -> dict:
+        scraped = [[name, kind, text, [[list(labels), value] for labels, value in samples]]
+                   for collector in self.collectors for name, kind, text, samples in collector()]
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[name, list(labels), value] for name, series in self.counters.items()
+                             for labels, value in series.items()],
+                "histograms": [[name, list(labels), h.buckets, h.counts, h.sum]
+                               for name, series in self.histograms.items() for labels, h in series.items()],
+                "scraped": scraped,
+            }
+
+    def flush(self):
+        """write this process' numbers to its file"""
+        with self.file_lock:
+            if self.directory and self.path:
+                write_json(self.path, self.snapshot())
+
+    def retire(self):
+        """
+        for a worker that exits: its counters and histograms are added to the retired file and its
+        own file is removed, so totals don't go down and the directory doesn't keep a file per
+        worker that ever ran. its gauges go with it
+        """
+        import fcntl  # gunicorn only, which does not run on Windows
+        with self.file_lock:
+            if not (self.directory and self.path):
+                return
+            path, self.path = self.path, None  # the flusher stops writing it
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            with open(retired_path + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # workers exiting together take turns, closing unlocks
+                try:
+                    with open(retired_path) as f:
+                        retired = [json.load(f)]
+                except (OSError, ValueError):  # the first worker to exit
+                    retired = []
+                total = add_up(retired + [self.snapshot()])
+                # a scrape reading both files before the remove below skips this one, it is in the total
+                total["merged"] = [name for snapshot in retired for name in snapshot["merged"]
+                                   if os.path.exists(os.path.join(self.directory, name))]
+                total["merged"].append(os.path.basename(path))
+                write_json(retired_path, total)
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # exited before its first flush
+                pass
+
+    def snapshots(self) -> list:
+        if not self.directory:
+            return [self.snapshot()]
+        with self.lock:
+            self._start_flusher()
+        self.flush()  # this worker's own numbers are current, the others' are FLUSH_SECONDS old at most
+        found = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    found.append((os.path.getmtime(path), os.path.basename(path), json.load(f)))
+            except (OSError, ValueError):  # removed meanwhile
+                continue
+        merged = {name for _, _, snapshot in found for name in snapshot.get("merged", [])}
+        return [snapshot for _, name, snapshot in sorted(found, key=lambda f: f[0]) if name not in merged]
+
+    def render(self) -> str:
+        """
+        counters and histograms add up every process that wrote a file. gauges are per process:
+        a pid label, and only the processes still running
+        """
+        counters = defaultdict(lambda: defaultdict(int))
+        histograms = defaultdict(dict)
+        scraped = {}  # name -> (type, help, {labels: value})
+        gauges = {}  # pid -> gauges of its newest file, a reused pid replaces an exited one
+        for snapshot in self.snapshots():
+            for name, labels, value in snapshot["counters"]:
+                counters[name][tuple(map(tuple, labels))] += value
+            for name, labels, buckets, counts, total in snapshot["histograms"]:
+                labels = tuple(map(tuple, labels))
+                histogram = histograms[name].get(labels)
+                if histogram is None:
+                    histogram = histograms[name][labels] = Histogram(tuple(buckets))
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+            for name, kind, text, samples in snapshot["scraped"]:
+                series = scraped.setdefault(name, (kind, text, defaultdict(int)))[2]
+                if kind == "counter":
+                    for labels, value in samples:
+                        series[tuple(map(tuple, labels))] += value
+                elif self.directory is None or process_running(snapshot["pid"]):
+                    gauges.setdefault(snapshot["pid"], {})[name] = samples
+        for pid, samples_by_name in gauges.items():
+            pid_label = () if self.directory is None else (("pid", pid),)
+            for name, samples in samples_by_name.items():
+                for labels, value in samples:
+                    scraped[name][2][tuple(map(tuple, labels)) + pid_label] = value
+
+        lines = []
+        for name, (kind, text) in DESCRIPTIONS.items():
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            if kind == "counter":
+                lines += [f"{name}{format_labels(labels)} {value}" for labels, value in counters[name].items()]
+            else:
+                for labels, histogram in histograms[name].items():
+                    lines.extend(histogram.samples(name, labels))
+        for name, (kind, text, samples) in scraped.items():
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{format_labels(labels)} {value}" for labels, value in samples.items()]
+        return "\n".join(lines) + "\n"
+
+
+def add_up(snapshots) -> dict:
+    """one snapshot with the counters and histograms of all of them added up, gauges left out"""
+    counters = defaultdict(int)
+    histograms = {}
+    scraped = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, buckets, counts, total in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(tuple(buckets))
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.sum += total
+        for name, kind, text, samples in snapshot["scraped"]:
+            if kind == "counter":
+                series = scraped.setdefault(name, (kind, text, defaultdict(int)))[2]
+                for labels, value in samples:
+                    series[tuple(map(tuple, labels))] += value
+    return {
+        "pid": None,
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), h.buckets, h.counts, h.sum] for (name, labels), h in histograms.items()],
+        "scraped": [[name, kind, text, [[list(labels), value] for labels, value in series.items()]]
+                    for name, (kind, text, series) in scraped.items()],
+    }
+
+
+def write_json(path, data):
+    # replaced in one go, so readers never see half of it
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # the flusher and a scrape may both write
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def process_running(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running, as another user
+        return True
+    return True
+
+
+metrics = Metrics()
+if hasattr(os, "register_at_fork"):  # not on Windows
+    os.register_at_fork(after_in_child=metrics.reset)
@@ -2,7 +2,12 @@ from __future__ import annotations
 
 from typing import Optional, List
 import datetime
+import hashlib
+import unicodedata
+from collections import defaultdict
 from sqlalchemy import String, Text, Float, Boolean, Date
+from sqlalchemy import inspect, select, text, update, delete, insert, or_, table, column, func
+from sqlalchemy.exc import DBAPIError
 
 from sqlalchemy import (
     ForeignKey,
@@ -16,9 +21,21 @@ from sqlalchemy.orm import (
     Mapped,
     mapped_column,
     relationship,
+    validates,
 )
 
 
+def normalize(text: str) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return text.lower().strip()
+
+
+HIDDEN_TAG = "+18"  # groups with a tag containing this are only shown to Yosh
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -37,17 +54,28 @@ class Tag(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), unique=True)
+    name_norm: Mapped[Optional[str]] = mapped_column(String(100), index=True)
+
+    @validates("name")
+    def _set_name_norm(self, key, value):
+        self.name_norm = normalize(value)
+        return value
 
 
 class Battery(Base):
     __tablename__ = "battery"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    voltage: Mapped[Optional[float]] = mapped_column(Float)
-    current: Mapped[Optional[float]] = mapped_column(Float)
-    capacity: Mapped[Optional[float]] = mapped_column(Float)
+    voltage: Mapped[Optional[float]] = mapped_column(Float, index=True)
+    current: Mapped[Optional[float]] = mapped_column(Float, index=True)
+    capacity: Mapped[Optional[float]] = mapped_column(Float, index=True)
     charging_type: Mapped[Optional[str]] = mapped_column(String(50))
+    charging_type_norm: Mapped[Optional[str]] = mapped_column(String(50), index=True)
 
+    @validates("charging_type")
+    def _set_charging_type_norm(self, key, value):
+        self.charging_type_norm = normalize(value) if value else None
+        return value
 
 
 class ItemGroup(Base):
@@ -59,7 +87,10 @@ class ItemGroup(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100))
+    name_norm: Mapped[Optional[str]] = mapped_column(String(100), index=True)
     instruction: Mapped[Optional[str]] = mapped_column(Text)
+    # denormalized from the tags by refresh_hidden(), so visibility is a plain indexed lookup
+    hidden: Mapped[Optional[bool]] = mapped_column(Boolean, default=False, index=True)
 
     battery_id: Mapped[Optional[int]] = mapped_column(
         ForeignKey("battery.id"),
@@ -70,6 +101,17 @@ class ItemGroup(Base):
     items = relationship("Item", back_populates="group")
     tags = relationship("Tag", secondary=tag_association)
 
+    @validates("name")
+    def _set_name_norm(self, key, value):
+        self.name_norm = normalize(value)
+        return value
+
+    def refresh_hidden(self):
+        self.hidden = any(HIDDEN_TAG in tag.name for tag in self.tags)
+
+
+LOCATION_PATH_LENGTH = 500
+
 
 class Location(Base):
     __tablename__ = "location"
@@ -80,6 +122,10 @@ class Location(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100))
+    name_norm: Mapped[Optional[str]] = mapped_column(String(100), index=True)
+    # materialized "A > B > C", kept up to date by refresh_location_paths()
+    path: Mapped[Optional[str]] = mapped_column(String(LOCATION_PATH_LENGTH))
+    path_norm: Mapped[Optional[str]] = mapped_column(String(LOCATION_PATH_LENGTH), index=True)
 
     parent_id: Mapped[Optional[int]] = mapped_column(
         ForeignKey("location.id"),
@@ -89,26 +135,514 @@ class Location(Base):
 
     items = relationship("Item", back_populates="location")
 
+    @validates("name")
+    def _set_name_norm(self, key, value):
+        self.name_norm = normalize(value)
+        return value
+
+    @validates("path")
+    def _set_path_norm(self, key, value):
+        self.path_norm = normalize(value)
+        return value
+
+    def is_ancestor_of(self, other) -> bool:
+        return bool(other and other.path and other.path.startswith(f"{self.path} > "))
+
 
 class Item(Base):
     __tablename__ = "item"
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
-    last_seen_date: Mapped[Optional[datetime.date]] = mapped_column(Date)
-    last_use_date: Mapped[Optional[datetime.date]] = mapped_column(Date)
+    last_seen_date: Mapped[Optional[datetime.date]] = mapped_column(Date, index=True)
+    last_use_date: Mapped[Optional[datetime.date]] = mapped_column(Date, index=True)
     has_dedicated_cable: Mapped[Optional[bool]] = mapped_column(Boolean)
-    acquired_date: Mapped[Optional[datetime.date]] = mapped_column(Date)
+    acquired_date: Mapped[Optional[datetime.date]] = mapped_column(Date, index=True)
 
     bought_place: Mapped[Optional[str]] = mapped_column(String(100))
     variant: Mapped[Optional[str]] = mapped_column(String(100))
     color: Mapped[Optional[str]] = mapped_column(String(50))
     status: Mapped[Optional[str]] = mapped_column(String(50))
-    price: Mapped[Optional[float]] = mapped_column(Float)
+    price: Mapped[Optional[float]] = mapped_column(Float, index=True)
 
+    # accent-folded, lowercased copies used by the search endpoints
+    bought_place_norm: Mapped[Optional[str]] = mapped_column(String(100), index=True)
+    variant_norm: Mapped[Optional[str]] = mapped_column(String(100), index=True)
+    color_norm: Mapped[Optional[str]] = mapped_column(String(50), index=True)
+    status_norm: Mapped[Optional[str]] = mapped_column(String(50), index=True)
 
-    group_id: Mapped[int] = mapped_column(ForeignKey("item_group.id"))
+    group_id: Mapped[int] = mapped_column(ForeignKey("item_group.id"), index=True)
     group = relationship("ItemGroup", back_populates="items")
 
-    location_id: Mapped[int] = mapped_column(ForeignKey("location.id"))
+    location_id: Mapped[int] = mapped_column(ForeignKey("location.id"), index=True)
     location = relationship("Location", back_populates="items")
+
+    @validates("bought_place", "variant", "color", "status")
+    def _set_search_norm(self, key, value):
+        setattr(self, f"{key}_norm", normalize(value) if value else None)
+        return value
+
+
+class DataVersion(Base):
+    """one row, bumped by every write: the data generation all workers agree on"""
+    __tablename__ = "data_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0)
+
+
+class SchemaVersion(Base):
+    """one row: fingerprint of the models the database was last upgraded to"""
+    __tablename__ = "schema_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+
+
+# /api/stats: item count and price sum kept up to date by the writes, see apply_rollup().
+# hidden_* is the part in +18 groups, taken away for everyone but Yosh
+class LocationStats(Base):
+    """totals of a location and of every location below it"""
+    __tablename__ = "location_stats"
+
+    location_id: Mapped[int] = mapped_column(ForeignKey("location.id"), primary_key=True)
+    item_count: Mapped[int] = mapped_column(default=0)
+    price_sum: Mapped[float] = mapped_column(Float, default=0)
+    hidden_count: Mapped[int] = mapped_column(default=0)
+    hidden_price_sum: Mapped[float] = mapped_column(Float, default=0)
+
+
+class GroupStats(Base):
+    __tablename__ = "group_stats"
+
+    item_group_id: Mapped[int] = mapped_column(ForeignKey("item_group.id"), primary_key=True)
+    item_count: Mapped[int] = mapped_column(default=0)
+    price_sum: Mapped[float] = mapped_column(Float, default=0)
+
+
+class TagStats(Base):
+    """totals of the items whose group has the tag"""
+    __tablename__ = "tag_stats"
+
+    tag_id: Mapped[int] = mapped_column(ForeignKey("tag.id"), primary_key=True)
+    item_count: Mapped[int] = mapped_column(default=0)
+    price_sum: Mapped[float] = mapped_column(Float, default=0)
+    hidden_count: Mapped[int] = mapped_column(default=0)
+    hidden_price_sum: Mapped[float] = mapped_column(Float, default=0)
+
+
+# model -> columns that have a "<column>_norm" shadow column
+NORMALIZED_COLUMNS = {
+    Tag: ("name",),
+    Battery: ("charging_type",),
+    ItemGroup: ("name",),
+    Location: ("name",),
+    Item: ("bought_place", "variant", "color", "status"),
+}
+
+
+def with_normalized_columns(model, values: dict) -> dict:
+    """bulk inserts skip @validates, so fill the *_norm columns of `values` by hand"""
+    for column in NORMALIZED_COLUMNS.get(model, ()):
+        value = values.get(column)
+        values[f"{column}_norm"] = normalize(value) if value else None
+    return values
+
+
+# /api/search: item_fts holds one row per item with the normalized text of these fields.
+# SQLite: an FTS5 table whose rowid is the item id. MySQL: a table with a FULLTEXT index.
+# the weights rank a match in the group name above one in the instruction (SQLite's bm25 only)
+FULLTEXT_WEIGHTS = {
+    "group_name": 4.0, "tags": 3.0, "variant": 2.0, "color": 2.0,
+    "location": 1.5, "status": 1.0, "bought_place": 1.0, "instruction": 0.5,
+}
+FULLTEXT_DIALECTS = ("sqlite", "mysql")
+FULLTEXT_BATCH_SIZE = 1000
+
+
+def fulltext_table(dialect_name):
+    """item_fts for building statements, and its item id column"""
+    item_id = column("rowid" if dialect_name == "sqlite" else "item_id")
+    return table("item_fts", item_id, column("hidden"), *map(column, FULLTEXT_WEIGHTS)), item_id
+
+
+def create_fulltext_index(engine):
+    # not in Base.metadata: create_all() can't make an FTS5 table
+    columns = ", ".join(FULLTEXT_WEIGHTS)
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5({columns}, hidden UNINDEXED)"))
+        elif engine.dialect.name == "mysql":
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS item_fts (item_id INTEGER PRIMARY KEY, hidden BOOLEAN NOT NULL, "
+                + "".join(f"{c} TEXT, " for c in FULLTEXT_WEIGHTS)
+                + f"FULLTEXT INDEX ft_item_fts ({columns})) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"))
+
+
+def fulltext_rows(session, ids, item_id) -> list:
+    """item_fts rows of these items, from two queries whatever their number"""
+    items = session.execute(
+        select(Item.id, Item.group_id, Item.variant_norm, Item.color_norm, Item.status_norm,
+               Item.bought_place_norm, ItemGroup.name_norm.label("group_name"), ItemGroup.instruction,
+               ItemGroup.hidden, Location.path_norm.label("location"))
+        .join(ItemGroup, Item.group_id == ItemGroup.id)
+        .join(Location, Item.location_id == Location.id)
+        .where(Item.id.in_(ids))).all()
+    tags = defaultdict(list)
+    for group_id, name in session.execute(
+            select(tag_association.c.item_group_id, Tag.name_norm)
+            .join(Tag, Tag.id == tag_association.c.tag_id)
+            .where(tag_association.c.item_group_id.in_({i.group_id for i in items}))):
+        tags[group_id].append(name or "")
+    return [{
+        item_id.name: i.id,
+        "group_name": i.group_name or "",
+        "tags": " ".join(tags[i.group_id]),
+        "variant": i.variant_norm or "",
+        "color": i.color_norm or "",
+        "location": i.location or "",
+        "status": i.status_norm or "",
+        "bought_place": i.bought_place_norm or "",
+        "instruction": normalize(i.instruction),
+        "hidden": bool(i.hidden),
+    } for i in items]
+
+
+def refresh_fulltext_items(session, ids):
+    """
+    rewrite the item_fts rows of these items, drop those of deleted ones. call it in the
+    write's transaction, after the flush that gives new items their id
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in FULLTEXT_DIALECTS:
+        return
+    fts, item_id = fulltext_table(dialect)
+    ids = list(ids)
+    for start in range(0, len(ids), FULLTEXT_BATCH_SIZE):
+        chunk = ids[start:start + FULLTEXT_BATCH_SIZE]
+        session.execute(delete(fts).where(item_id.in_(chunk)))
+        rows = fulltext_rows(session, chunk, item_id)
+        if rows:
+            session.execute(insert(fts), rows)
+
+
+def refresh_fulltext(session, condition):
+    """refresh_fulltext_items() for the items matching condition, a where clause on Item"""
+    refresh_fulltext_items(session, session.scalars(select(Item.id).where(condition)).all())
+
+
+def location_subtree(location):
+    """ids of location and of every location below it, once their paths are refreshed"""
+    return select(Location.id).where(or_(
+        Location.id == location.id, Location.path.startswith(f"{location.path} > ", autoescape=True)))
+
+
+ROLLUP_COLUMNS = ("item_count", "price_sum", "hidden_count", "hidden_price_sum")
+ROLLUP_BATCH_SIZE = 1000
+
+
+def location_ancestors(session, location_ids=None) -> dict:
+    """location id -> [its id, its parent's, ... the root's], one query per level. None: every location"""
+    parents = {}
+    if location_ids is None:
+        parents.update(session.execute(select(Location.id, Location.parent_id)).all())
+        location_ids = list(parents)
+    todo = set(location_ids) - {None}
+    while todo:
+        rows = session.execute(select(Location.id, Location.parent_id).where(Location.id.in_(todo))).all()
+        parents.update(rows)
+        todo = {parent for _, parent in rows if parent is not None and parent not in parents}
+    chains = {}
+    for location_id in location_ids:
+        if location_id is None:
+            continue
+        chain = chains[location_id] = []
+        while location_id is not None:  # create_location refuses cycles
+            chain.append(location_id)
+            location_id = parents.get(location_id)
+    return chains
+
+
+def group_states(session, group_ids=None) -> dict:
+    """group id -> (hidden, tag ids), what decides where its items count. None: every group"""
+    groups = select(ItemGroup.id, ItemGroup.hidden)
+    tags = select(tag_association.c.item_group_id, tag_association.c.tag_id)
+    if group_ids is not None:
+        groups = groups.where(ItemGroup.id.in_(group_ids))
+        tags = tags.where(tag_association.c.item_group_id.in_(group_ids))
+    states = {group_id: (bool(hidden), []) for group_id, hidden in session.execute(groups)}
+    for group_id, tag_id in session.execute(tags):
+        states[group_id][1].append(tag_id)
+    return states
+
+
+def add_to_rollup(session, model, deltas):
+    """
+    row += delta for each key -> [count, price, hidden count, hidden price] of deltas.
+    one upsert adding to the stored values: concurrent writes don't lose each other's deltas
+    """
+    if not deltas:
+        return
+    stats = model.__table__
+    key = list(stats.primary_key)[0]
+    columns = [c for c in ROLLUP_COLUMNS if c in stats.c]
+    rows = [{key.name: k, **dict(zip(columns, delta))} for k, delta in deltas.items()]
+    # the dialect modules are imported here: a process only ever loads the one it runs on
+    if session.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(stats)
+        stmt = stmt.on_duplicate_key_update({c: stats.c[c] + stmt.inserted[c] for c in columns})
+    else:
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(stats)
+        stmt = stmt.on_conflict_do_update(index_elements=[key],
+                                          set_={c: stats.c[c] + stmt.excluded[c] for c in columns})
+    session.execute(stmt, rows)
+
+
+def apply_rollup(session, entries, states=None, chains=None):
+    """
+    add (location id, group id, item count, price sum) entries to the rollups, negative counts
+    and sums take items away. states: group_states() to use instead of the groups' current ones
+    """
+    entries = [e for e in entries if e[2] or e[3]]
+    if not entries:
+        return
+    states = dict(states or {})
+    missing = {e[1] for e in entries} - states.keys()
+    if missing:
+        states.update(group_states(session, missing))
+    if chains is None:
+        chains = location_ancestors(session, {e[0] for e in entries})
+    locations, groups, tags = (defaultdict(lambda: [0, 0.0, 0, 0.0]) for _ in range(3))
+    for location_id, group_id, count, price in entries:
+        hidden, tag_ids = states.get(group_id, (False, ()))
+        delta = (count, price or 0.0, count if hidden else 0, (price or 0.0) if hidden else 0.0)
+        targets = [locations[l] for l in chains.get(location_id, ())]
+        targets += [tags[t] for t in tag_ids] + [groups[group_id]]
+        for target in targets:
+            for i, d in enumerate(delta):
+                target[i] += d
+    add_to_rollup(session, LocationStats, locations)
+    add_to_rollup(session, GroupStats, groups)
+    add_to_rollup(session, TagStats, tags)
+
+
+def rollup_entries(condition=None):
+    entries = select(Item.location_id, Item.group_id, func.count(), func.coalesce(func.sum(Item.price), 0))
+    if condition is not None:
+        entries = entries.where(condition)
+    return entries.group_by(Item.location_id, Item.group_id)
+
+
+def rollup_items(session, ids, sign=1):
+    """
+    add (sign=1) or take away (sign=-1) these items from the rollups, as they are in the database:
+    take them away before the write changes or deletes them, add them after it is flushed
+    """
+    ids = list(ids)
+    entries = []
+    for start in range(0, len(ids), ROLLUP_BATCH_SIZE):
+        entries += session.execute(rollup_entries(Item.id.in_(ids[start:start + ROLLUP_BATCH_SIZE]))).all()
+    apply_rollup(session, [(l, g, sign * c, sign * p) for l, g, c, p in entries])
+
+
+def rollup_moved_location(session, location, old_parent_id):
+    """location got a new parent: its totals, subtree included, leave the old ancestors for the new ones"""
+    stats = session.get(LocationStats, location.id)
+    if stats is None or old_parent_id == location.parent_id:
+        return
+    totals = [stats.item_count, stats.price_sum, stats.hidden_count, stats.hidden_price_sum]
+    chains = location_ancestors(session, {old_parent_id, location.parent_id})
+    deltas = defaultdict(lambda: [0, 0.0, 0, 0.0])
+    for sign, parent_id in ((-1, old_parent_id), (1, location.parent_id)):
+        for ancestor in chains.get(parent_id, ()):
+            deltas[ancestor] = [d + sign * t for d, t in zip(deltas[ancestor], totals)]
+    add_to_rollup(session, LocationStats, deltas)
+
+
+def group_state(group) -> tuple:
+    """group_states() of a loaded group, before an edit"""
+    return bool(group.hidden), [tag.id for tag in group.tags]
+
+
+def rollup_regrouped(session, before):
+    """
+    before: group id -> group_state() before their edit. the items of groups whose tags or
+    visibility changed move between the tag rollups and the hidden part of the others
+    """
+    after = group_states(session, before)
+    changed = [g for g, (hidden, tag_ids) in before.items()
+               if g in after and (hidden, sorted(tag_ids)) != (after[g][0], sorted(after[g][1]))]
+    if not changed:
+        return
+    entries = []
+    for start in range(0, len(changed), ROLLUP_BATCH_SIZE):
+        entries += session.execute(
+            rollup_entries(Item.group_id.in_(changed[start:start + ROLLUP_BATCH_SIZE]))).all()
+    apply_rollup(session, [(l, g, -c, -p) for l, g, c, p in entries], states=before)
+    apply_rollup(session, entries, states=after)
+
+
+def rebuild_rollups(session):
+    """recompute the rollups from the items, for data written around the endpoints"""
+    for model in (LocationStats, GroupStats, TagStats):
+        session.execute(delete(model))
+    apply_rollup(session, session.execute(rollup_entries()).all(),
+                 states=group_states(session), chains=location_ancestors(session))
+    session.commit()
+
+
+def upgrade_schema(engine):
+    """create_all() only creates missing tables, so add missing columns and indexes by hand"""
+    Base.metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+
+
+def backfill_normalized_columns(session):
+    """fill the *_norm columns of rows written before they existed"""
+    for model, columns in NORMALIZED_COLUMNS.items():
+        for column in columns:
+            raw = getattr(model, column)
+            norm = getattr(model, f"{column}_norm")
+            rows = session.execute(
+                select(model.id, raw).where(raw.is_not(None), norm.is_(None))
+            ).all()
+            if rows:
+                session.execute(update(model), [
+                    {"id": row_id, f"{column}_norm": normalize(value)}
+                    for row_id, value in rows
+                ])
+    session.commit()
+
+
+def backfill_fulltext(session):
+    # fill item_fts when it was just created, FULLTEXT_BATCH_SIZE items at a time
+    dialect = session.get_bind().dialect.name
+    if dialect not in FULLTEXT_DIALECTS:
+        return
+    fts, item_id = fulltext_table(dialect)
+    if session.execute(select(item_id).select_from(fts).limit(1)).first():
+        return
+    last = 0
+    while True:
+        ids = session.scalars(select(Item.id).where(Item.id > last)
+                              .order_by(Item.id).limit(FULLTEXT_BATCH_SIZE)).all()
+        if not ids:
+            break
+        refresh_fulltext_items(session, ids)
+        last = ids[-1]
+    session.commit()
+
+
+def backfill_rollups(session):
+    if session.query(Item.id).first() and not session.query(LocationStats.location_id).first():
+        rebuild_rollups(session)
+
+
+def refresh_location_paths(session, location=None) -> int:
+    """recompute the path of `location` and its descendants, or of every location. returns the longest"""
+    locations = session.query(Location).all()
+    by_id = {loc.id: loc for loc in locations}
+    children = defaultdict(list)
+    for loc in locations:
+        children[loc.parent_id].append(loc)
+
+    if location is None:
+        stack = [(root, None) for root in children[None]]
+    else:
+        parent = by_id.get(location.parent_id)
+        stack = [(location, parent.path if parent else None)]
+    longest = 0
+    while stack:
+        loc, parent_path = stack.pop()
+        loc.path = f"{parent_path} > {loc.name}" if parent_path else loc.name
+        longest = max(longest, len(loc.path))
+        stack.extend((child, loc.path) for child in children[loc.id])
+    return longest
+
+
+def backfill_location_paths(session):
+    if session.query(Location.id).filter(Location.path.is_(None)).first():
+        refresh_location_paths(session)
+        session.commit()
+
+
+def backfill_hidden_groups(session):
+    groups = session.query(ItemGroup).filter(ItemGroup.hidden.is_(None)).all()
+    for group in groups:
+        group.refresh_hidden()
+    if groups:
+        session.commit()
+
+
+def backfill_data_version(session):
+    if session.get(DataVersion, 1) is None:
+        session.add(DataVersion(id=1, version=0))
+        session.commit()
+
+
+def get_data_version(session) -> int:
+    return session.scalar(select(DataVersion.version).where(DataVersion.id == 1)) or 0
+
+
+def bump_data_version(session) -> int:
+    """call before the write's commit: the bump commits or rolls back with it. returns the new version"""
+    session.execute(update(DataVersion).where(DataVersion.id == 1)
+                    .values(version=DataVersion.version + 1))
+    return get_data_version(session)
+
+
+def schema_fingerprint() -> str:
+    # changes whenever a table, column, column type or index of the models does
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type}" for column in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes))
+    parts.append("item_fts:" + ",".join(FULLTEXT_WEIGHTS))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def schema_is_current(engine) -> bool:
+    """one small query instead of reflecting every table"""
+    try:
+        with engine.connect() as conn:
+            stored = conn.execute(
+                select(SchemaVersion.fingerprint).where(SchemaVersion.id == 1)).scalar()
+    except DBAPIError:  # no schema_version table yet
+        return False
+    return stored == schema_fingerprint()
+
+
+def init_db(engine, session_factory, force=False) -> bool:
+    """
+    upgrade the schema and backfill the columns it added, unless the stored fingerprint
+    says this was already done for these models. returns whether anything ran
+    """
+    if not force and schema_is_current(engine):
+        return False
+    upgrade_schema(engine)
+    create_fulltext_index(engine)
+    with session_factory() as session:
+        backfill_normalized_columns(session)
+        backfill_location_paths(session)
+        backfill_hidden_groups(session)
+        backfill_fulltext(session)
+        backfill_rollups(session)
+        backfill_data_version(session)
+        session.merge(SchemaVersion(id=1, fingerprint=schema_fingerprint()))
+        session.commit()
+    return True
@@ -0,0 +1,279 @@
+import calendar
+import math
+import re
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, DecimalException
+from typing import Any, Callable, Optional
+
+from sqlalchemy import String, and_, cast, false, func, literal_column, or_, select, true
+from sqlalchemy.orm import aliased
+
+from models import (Battery, Item, ItemGroup, Location, Tag, normalize,
+                    FULLTEXT_WEIGHTS, fulltext_table)
+
+# match types
+SUBSTRING = "substring"  # accent/case-insensitive substring on a *_norm column
+NUMERIC = "numeric"  # q=5 is [5, 6), q=5.2 is [5.2, 5.3), plus optional min/max
+DATE = "date"  # q is the start of an ISO date: "2025", "2025-03", "2025-03-1"...
+ID = "id"  # exact id, autocomplete by prefix
+
+PREFIX_DIGITS = 6  # autocomplete: "13" also suggests 130-139, 1300-1399, ... up to 6 more digits
+
+
+@dataclass(frozen=True)
+class SearchField:
+    """how one /api/items/<key> search maps onto the database"""
+    column: Any  # column the match runs on
+    label: Any = None  # column returned by autocomplete, defaults to `column`
+    joins: tuple = ()  # relationship path from Item to the column
+    match: str = SUBSTRING
+    index: Optional[str] = None  # AutocompleteIndex field answering autocomplete, if any
+    newest_first: bool = False  # autocomplete order
+    prepare: Callable[[str], str] = normalize  # applied to ?q= before matching
+
+    @property
+    def label_column(self):
+        return self.column if self.label is None else self.label
+
+    def condition(self, q, low=None, high=None):
+        if self.match == SUBSTRING:
+            return self.column.contains(q, autoescape=True)
+        if self.match == ID:
+            return self.column == int(q) if q.isascii() and q.isdigit() else false()
+        if self.match == NUMERIC:
+            return numeric_condition(self.column, q, low, high)
+        if self.match == DATE:
+            return date_condition(self.column, q)
+        return cast(self.column, String).contains(q, autoescape=True)
+
+    @property
+    def prefix_monotone(self):
+        # what matches "pro" also matches "pr", so a shorter q's answer can be filtered down
+        return self.match in (SUBSTRING, DATE)
+
+    def narrow(self, results, q):
+        """autocomplete results of a shorter q, filtered to q, in the order a fresh search gives"""
+        if self.match == DATE:
+            return [r for r in results if r["label"].startswith(q)]
+        found = [(normalize(r["label"]), r) for r in results]
+        found = sorted(((norm, r) for norm, r in found if q in norm),
+                       key=lambda pair: (not pair[0].startswith(q), pair[0], pair[1]["label"]))
+        return [r for _, r in found]
+
+    def autocomplete_condition(self, q, low=None, high=None):
+        # while typing, q is the start of a number: "13" may become 1300
+        if self.match == ID:
+            return numeric_condition(self.column, q, prefix=True) if q.isascii() and q.isdigit() or not q else false()
+        if self.match == NUMERIC:
+            return numeric_condition(self.column, q, low, high, prefix=True)
+        return self.condition(q, low, high)
+
+
+def numeric_range(q: str):
+    """the values a typed number stands for: "5" -> [5, 6), "5.2" -> [5.2, 5.3), "-5" -> (-6, -5]"""
+    try:
+        value = Decimal(q)
+        if not value.is_finite():
+            return None
+        step = Decimal(1).scaleb(min(value.as_tuple().exponent, 0))
+    except DecimalException:
+        return None
+    # the columns are floats: "1e999999999" or "1e-999999999" can't match and would overflow the range
+    if not in_float_range(value) or float(step) == 0:
+        return None
+    return value, step
+
+
+def in_float_range(value: Decimal) -> bool:
+    return math.isfinite(float(value)) and math.isfinite(float(value * 10))
+
+
+def numeric_ranges(q: str, prefix=False):
+    typed = numeric_range(q)
+    if typed is None:
+        return []
+    value, step = typed
+    ranges = [(value, step)]
+    if prefix and "." not in q and "e" not in q.lower():
+        for _ in range(PREFIX_DIGITS):
+            if not in_float_range(value * 10):
+                break
+            value, step = value * 10, step * 10
+            ranges.append((value, step))
+    return ranges
+
+
+def numeric_condition(column, q, low=None, high=None, prefix=False):
+    # plain range comparisons only, so the index on the column can be used
+    conditions = [column.is_not(None)]
+    if q:
+        ranges = numeric_ranges(q, prefix)
+        if not ranges:
+            return false()
+        conditions.append(or_(*[
+            and_(column > float(value - step), column <= float(value)) if value.is_signed()
+            else and_(column >= float(value), column < float(value + step))
+            for value, step in ranges
+        ]))
+    if low is not None:
+        conditions.append(column >= low)
+    if high is not None:
+        conditions.append(column <= high)
+    return and_(true(), *conditions)
+
+
+ISO_DATE_PREFIX = re.compile(r"(\d{1,4})(?:-(\d{0,2})(?:-(\d{0,2}))?)?")
+
+
+def date_range(q: str):
+    """
+    first and last date whose ISO form starts with q: "2025" is the whole year,
+    "2025-03-1" is the 10th to the 19th. ISO order is date order, so it is one range.
+    """
+    m = ISO_DATE_PREFIX.fullmatch(q)
+    if not m:
+        return None
+    year, month, day = m.groups()
+    if month is not None and len(year) < 4:
+        return None
+
+    def span(digits, width, lowest, highest):
+        # a partly typed number can still become anything between these
+        low = max(int(digits.ljust(width, "0")), lowest)
+        high = min(int(digits.ljust(width, "9")), highest)
+        return (low, high) if low <= high else None
+
+    years = span(year, 4, 1, 9999)
+    if years is None:
+        return None
+    if month is None:
+        return date(years[0], 1, 1), date(years[1], 12, 31)
+    y = years[0]
+    if day is None or len(month) < 2:
+        if day is not None:
+            return None
+        months = span(month, 2, 1, 12)
+        if months is None:
+            return None
+        return date(y, months[0], 1), date(y, months[1], calendar.monthrange(y, months[1])[1])
+    m = int(month)
+    if not 1 <= m <= 12:
+        return None
+    days = span(day, 2, 1, calendar.monthrange(y, m)[1])
+    if days is None:
+        return None
+    return date(y, m, days[0]), date(y, m, days[1])
+
+
+def date_condition(column, q):
+    if not q:
+        return column.is_not(None)
+    dates = date_range(q)
+    if dates is None:
+        return false()
+    return column.between(*dates)
+
+
+def last_location_segment(q: str) -> str:
+    # the frontend sends full paths ("A > B"), only the last part is searched
+    return normalize(q.rsplit(">", 1)[-1])
+
+
+def strip(q: str) -> str:
+    return q.strip()
+
+
+SEARCH_FIELDS = {
+    "tag": SearchField(Tag.name_norm, Tag.name, (Item.group, ItemGroup.tags), index="tag"),
+    "location": SearchField(Location.path_norm, Location.path, (Item.location,), index="location",
+                            prepare=last_location_segment),
+    "group": SearchField(ItemGroup.name_norm, ItemGroup.name, (Item.group,), index="group"),
+    "voltage": SearchField(Battery.voltage, joins=(Item.group, ItemGroup.battery), match=NUMERIC, prepare=strip),
+    "current": SearchField(Battery.current, joins=(Item.group, ItemGroup.battery), match=NUMERIC, prepare=strip),
+    "capacity": SearchField(Battery.capacity, joins=(Item.group, ItemGroup.battery), match=NUMERIC, prepare=strip),
+    "charging-type": SearchField(Battery.charging_type_norm, Battery.charging_type,
+                                 (Item.group, ItemGroup.battery), index="charging_type"),
+    "bought-place": SearchField(Item.bought_place_norm, Item.bought_place, index="bought_place"),
+    "variant": SearchField(Item.variant_norm, Item.variant, index="variant"),
+    "color": SearchField(Item.color_norm, Item.color, index="color"),
+    "status": SearchField(Item.status_norm, Item.status, index="status"),
+    "price": SearchField(Item.price, match=NUMERIC, prepare=strip),
+    "last-seen": SearchField(Item.last_seen_date, match=DATE, newest_first=True, prepare=strip),
+    "last-use": SearchField(Item.last_use_date, match=DATE, newest_first=True, prepare=strip),
+    "acquired": SearchField(Item.acquired_date, match=DATE, newest_first=True, prepare=strip),
+    "id": SearchField(Item.id, match=ID, newest_first=True, prepare=strip),
+    "group-id": SearchField(Item.group_id, match=ID, newest_first=True, prepare=strip),
+}
+
+
+def filter_hidden(query):
+    # query must select Item. aliased, so it also works on a query already joined to ItemGroup
+    group = aliased(ItemGroup)
+    return query.join(group, Item.group_id == group.id).filter(group.hidden.is_(False))
+
+
+def item_query(s, field: SearchField, q: str, allow_hidden: bool, low=None, high=None):
+    """Item rows matching q, as one statement: joins for to-one hops, EXISTS for collections"""
+    query = s.query(Item)
+    condition = field.condition(q, low, high)
+    for i, rel in enumerate(field.joins):
+        if rel.property.uselist:
+            # joining a collection would duplicate items, so the rest of the path becomes EXISTS
+            for inner in reversed(field.joins[i + 1:]):
+                condition = inner.any(condition) if inner.property.uselist else inner.has(condition)
+            condition = rel.any(condition)
+            break
+        query = query.join(rel)
+    query = query.filter(condition)
+    return query if allow_hidden else filter_hidden(query)
+
+
+def autocomplete(s, field: SearchField, q: str, allow_hidden: bool, low=None, high=None, limit=10):
+    """distinct labels of the matching items, deduplicated, ordered and limited in SQL"""
+    label = field.label_column
+    query = s.query(label).select_from(Item)
+    for rel in field.joins:
+        query = query.join(rel)
+    query = query.filter(label.is_not(None), field.autocomplete_condition(q, low, high))
+    if not allow_hidden:
+        query = filter_hidden(query)
+    query = query.distinct().order_by(label.desc() if field.newest_first else label).limit(limit)
+    values = [row[0] for row in query]
+    return [
+        {"id": v.isoformat() if isinstance(v, date) else v,
+         "label": v.isoformat() if isinstance(v, date) else str(v)}
+        for v in values
+    ]
+
+
+MYSQL_MIN_WORD = 3  # innodb_ft_min_token_size: shorter words are not in a FULLTEXT index
+
+
+def fulltext_query(dialect_name, q):
+    """every word of q, each one as a prefix: "pro con" finds "Pro Controller" """
+    words = re.findall(r"\w+", normalize(q))
+    if dialect_name == "sqlite":
+        return " ".join(f'"{w}"*' for w in words)
+    return " ".join(f"+{w}*" for w in words if len(w) >= MYSQL_MIN_WORD)
+
+
+def fulltext_ids(s, q, allow_hidden, limit):
+    """ids of the items matching q in item_fts, best first: one statement, LIMIT included"""
+    dialect = s.get_bind().dialect.name
+    fts, item_id = fulltext_table(dialect)
+    query = fulltext_query(dialect, q)
+    if not query:
+        return []
+    if dialect == "sqlite":
+        table = literal_column("item_fts")
+        condition = table.op("MATCH")(query)
+        rank = func.bm25(table, *FULLTEXT_WEIGHTS.values())  # lower is better
+    else:
+        from sqlalchemy.dialects.mysql import match  # not loaded by SQLite processes
+        condition = match(*(fts.c[c] for c in FULLTEXT_WEIGHTS), against=query).in_boolean_mode()
+        rank = condition.desc()  # MySQL's relevance, higher is better
+    statement = select(item_id).select_from(fts).where(condition)
+    if not allow_hidden:
+        statement = statement.where(fts.c.hidden == 0)
+    return list(s.scalars(statement.order_by(rank, item_id).limit(limit)))
@@ -0,0 +1,227 @@
+import bisect
+import heapq
+import itertools
+import threading
+from collections import defaultdict
+from sqlalchemy.orm import selectinload
+
+from models import Item, ItemGroup, normalize
+
+GRAM_SIZE = 3
+SMALL_MATCH_SET = 256  # above this, walk the sorted labels instead of sorting the matches
+SPARSE_MATCHES = 32  # ...unless fewer than 1 label in 32 matches, then the walk would be long
+ITEM_FIELDS = ("color", "variant", "status", "bought_place")
+
+
+def grams(text: str):
+    # every substring up to GRAM_SIZE long, so queries of 1 to 3 chars are a single lookup
+    return {
+        text[i:i + n]
+        for n in range(1, GRAM_SIZE + 1)
+        for i in range(len(text) - n + 1)
+    }
+
+
+class FieldIndex:
+    """labels of one autocomplete field, with visible/hidden reference counts"""
+
+    def __init__(self):
+        self.entries = {}  # label -> [id, norm, visible refs, hidden refs]
+        self.postings = defaultdict(set)  # gram -> labels
+        self.ordered = []  # (norm, label) sorted, for prefix ranges and early exits
+
+    def add(self, label, entry_id, hidden=False):
+        if not label:
+            return
+        entry = self.entries.get(label)
+        if entry is None:
+            norm = normalize(label)
+            entry = self.entries[label] = [entry_id, norm, 0, 0]
+            for gram in grams(norm):
+                self.postings[gram].add(label)
+            bisect.insort(self.ordered, (norm, label))
+        entry[3 if hidden else 2] += 1
+
+    def remove(self, label, hidden=False):
+        entry = self.entries.get(label)
+        if entry is None:
+            return
+        entry[3 if hidden else 2] -= 1
+        if entry[2] > 0 or entry[3] > 0:
+            return
+        del self.entries[label]
+        del self.ordered[bisect.bisect_left(self.ordered, (entry[1], label))]
+        for gram in grams(entry[1]):
+            labels = self.postings[gram]
+            labels.discard(label)
+            if not labels:
+                del self.postings[gram]
+
+    def candidates(self, q):
+        if len(q) <= GRAM_SIZE:
+            return self.postings.get(q, set())
+        sets = [self.postings.get(q[i:i + GRAM_SIZE], set()) for i in range(len(q) - GRAM_SIZE + 1)]
+        sets.sort(key=len)
+        return {label for label in sets[0].intersection(*sets[1:]) if q in self.entries[label][1]}
+
+    def search(self, q, allow_hidden=False, limit=10):
+        def allowed(label):
+            entry = self.entries[label]
+            return entry[2] > 0 or (allow_hidden and entry[3] > 0)
+
+        if not q:
+            found = (label for _, label in self.ordered if allowed(label))
+            return self.response(found, limit)
+        matches = self.candidates(q)
+        if len(matches) <= SMALL_MATCH_SET or len(matches) * SPARSE_MATCHES < len(self.ordered):
+            # prefix matches first, then alphabetical
+            best = heapq.nsmallest(limit, (label for label in matches if allowed(label)),
+                                   key=lambda label: (not self.entries[label][1].startswith(q), self.entries[label][1], label))
+            return self.response(best, limit)
+        # many matches: both passes over the sorted labels stop after `limit` hits
+        found = []
+        for norm, label in self.ordered[bisect.bisect_left(self.ordered, (q,)):]:
+            if len(found) >= limit or not norm.startswith(q):
+                break
+            if allowed(label):
+                found.append(label)
+        for norm, label in self.ordered:
+            if len(found) >= limit:
+                break
+            if label in matches and not norm.startswith(q) and allowed(label):
+                found.append(label)
+        return self.response(found, limit)
+
+    def response(self, labels, limit):
+        return [{"id": self.entries[label][0], "label": label} for label in itertools.islice(labels, limit)]
+
+
+class AutocompleteIndex:
+    """
+    in-process index answering every ?autocomplete=1 request without touching the database.
+    built once at startup, then patched by the write handlers. `version` is the data version
+    it reflects: writes from another worker show up as a newer version and need a rebuild.
+    """
+
+    FIELDS = ("group", "tag", "location", "charging_type") + ITEM_FIELDS
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.clear()
+
+    def clear(self):
+        self.fields = {name: FieldIndex() for name in self.FIELDS}
+        self.groups = {}  # group id -> (name, hidden, tags, charging type)
+        self.items = {}  # item id -> (group id, values of ITEM_FIELDS)
+        self.group_items = defaultdict(set)
+
+    def build(self, s, location_paths, version=None):
+        with self.lock:
+            self.clear()
+            self.version = version
+            groups = s.query(ItemGroup).options(
+                selectinload(ItemGroup.tags), selectinload(ItemGroup.battery))
+            for group in groups:
+                self._put_group(group)
+            columns = [getattr(Item, field) for field in ITEM_FIELDS]
+            for row in s.query(Item.id, Item.group_id, *columns):
+                self._put_item(row[0], row[1], tuple(row[2:]))
+            self._set_locations(location_paths)
+
+    def search(self, field, q, allow_hidden=False, limit=10):
+        with self.lock:
+            return self.fields[field].search(normalize(q), allow_hidden, limit)
+
+    def is_current(self, version):
+        return self.version == version
+
+    def invalidate(self):
+        # the next lookup rebuilds it
+        with self.lock:
+            self.version = None
+
+    # ---- incremental updates, called after a successful commit ----
+    # no-ops until the index is built: the build reads the committed data anyway
+
+    def advance(self, version):
+        # this worker's own write, already patched in. a gap means another worker wrote too
+        with self.lock:
+            if self.version is not None and self.version == version - 1:
+                self.version = version
+
+    def put_group(self, group):
+        with self.lock:
+            if self.version is None:
+                return
+            # the group's tags and visibility are counted once per item, so re-count them
+            items = {i: self.items[i][1] for i in self.group_items.get(group.id, ())}
+            for item_id in items:
+                self._remove_item(item_id)
+            self._put_group(group)
+            for item_id, values in items.items():
+                self._put_item(item_id, group.id, values)
+
+    def put_item(self, item):
+        with self.lock:
+            if self.version is None:
+                return
+            if item.group_id not in self.groups:
+                # a group created by another worker: only a rebuild knows its tags and visibility
+                self.version = None
+                return
+            self._remove_item(item.id)
+            values = tuple(getattr(item, field) for field in ITEM_FIELDS)
+            self._put_item(item.id, item.group_id, values)
+
+    def remove_item(self, item_id):
+        with self.lock:
+            if self.version is not None:
+                self._remove_item(item_id)
+
+    def set_locations(self, location_paths):
+        with self.lock:
+            if self.version is None:
+                return
+            self._set_locations(location_paths)
+
+    # ---- lock must be held ----
+
+    def _put_group(self, group):
+        old = self.groups.get(group.id)
+        if old:
+            self.fields["group"].remove(old[0], old[1])
+        tags = tuple((t.id, t.name) for t in group.tags)
+        hidden = bool(group.hidden)
+        charging_type = group.battery.charging_type if group.battery else None
+        self.groups[group.id] = (group.name, hidden, tags, charging_type)
+        self.fields["group"].add(group.name, group.id, hidden)
+
+    def _put_item(self, item_id, group_id, values):
+        self.items[item_id] = (group_id, values)
+        self.group_items[group_id].add(item_id)
+        _, hidden, tags, charging_type = self.groups[group_id]
+        for tag_id, name in tags:
+            self.fields["tag"].add(name, tag_id, hidden)
+        self.fields["charging_type"].add(charging_type, charging_type, hidden)
+        for field, value in zip(ITEM_FIELDS, values):
+            self.fields[field].add(value, value, hidden)
+
+    def _remove_item(self, item_id):
+        old = self.items.pop(item_id, None)
+        if old is None:
+            return
+        group_id, values = old
+        self.group_items[group_id].discard(item_id)
+        _, hidden, tags, charging_type = self.groups[group_id]
+        for _, name in tags:
+            self.fields["tag"].remove(name, hidden)
+        self.fields["charging_type"].remove(charging_type, hidden)
+        for field, value in zip(ITEM_FIELDS, values):
+            self.fields[field].remove(value, hidden)
+
+    def _set_locations(self, location_paths):
+        # a rename changes the path of every descendant, so locations are always rebuilt
+        index = self.fields["location"] = FieldIndex()
+        for loc_id, path in location_paths.items():
+            index.add(path, loc_id)
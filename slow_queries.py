@@ -0,0 +1,96 @@
+"""
+statements slower than INVENTORY_SLOW_QUERY_MS, with the plan the database chose for them.
+logged as warnings and kept in a ring buffer that admins read at /api/slow-queries
+"""
+import datetime
+import logging
+import os
+import threading
+from collections import deque
+
+import timing
+
+SLOW_QUERY_SECONDS = float(os.environ.get("INVENTORY_SLOW_QUERY_MS", 200)) / 1000  # 0 logs every statement
+LOG_SIZE = int(os.environ.get("INVENTORY_SLOW_QUERY_LOG_SIZE", 100))
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")  # EXPLAIN only plans these, it runs nothing
+
+logger = logging.getLogger(__name__)
+
+
+class SlowQueryLog:
+    def __init__(self, size=LOG_SIZE):
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=size)  # the oldest entries fall off
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def recent(self):
+        with self.lock:
+            return list(reversed(self.entries))
+
+
+slow_queries = SlowQueryLog()
+
+
+def redact(value):
+    # numbers, booleans and dates stay, they matter for the plan and aren't private. text doesn't
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float, datetime.date)):
+        return value.isoformat() if isinstance(value, datetime.date) else value
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__} of {len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def explain(dbapi_connection, dialect, statement, parameters):
+    """the plan of a statement, asked on the same connection so it sees the same data"""
+    if dialect not in ("sqlite", "mysql") or not statement.lstrip().upper().startswith(EXPLAINED):
+        return None
+    prefix = "EXPLAIN QUERY PLAN" if dialect == "sqlite" else "EXPLAIN"
+    # a raw DBAPI cursor: no engine events, and the statement's own cursor keeps its rows
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"{prefix} {statement}", parameters)
+        rows = cursor.fetchall()
+        if dialect == "sqlite":
+            # (id, parent, notused, detail) rows: indent each step under its parent
+            depth = {0: -1}
+            plan = []
+            for step_id, parent, _, detail in rows:
+                depth[step_id] = depth.get(parent, -1) + 1
+                plan.append("  " * depth[step_id] + detail)
+            return plan
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+    except Exception as e:  # the plan is a bonus, never fail the query for it
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        cursor.close()
+
+
+def record(dbapi_connection, statement, parameters, context, executemany, seconds):
+    """timing.instrument() listener, see db.py"""
+    if seconds < SLOW_QUERY_SECONDS:
+        return
+    request = timing.current()
+    entry = {
+        "at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "route": request.route if request else None,
+        "ms": round(seconds * 1000, 3),
+        "statement": statement,
+        # executemany: only the first row, and no plan
+        "parameters": redact(parameters[0] if executemany and parameters else parameters),
+        "rows": len(parameters) if executemany else None,
+        "plan": None,
+    }
+    # a streamed result (yield_per) may still be read: on MySQL, another statement would discard it
+    if not executemany and not context.execution_options.get("stream_results"):
+        entry["plan"] = explain(dbapi_connection, context.dialect.name, statement, parameters)
+    slow_queries.add(entry)
+    logger.warning("slow query (%.0f ms) on %s: %s %s plan: %s", entry["ms"], entry["route"],
+                   " ".join(statement.split()), entry["parameters"], entry["plan"])
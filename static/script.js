@@ -161,14 +161,55 @@ async function handleAutocompleteSelect({ input, item }) {
   }
 
   if (url) {
-    const res = await fetch(API_BASE + url, {
-      headers: {
-      "X-Yosh": YOSH_ENABLED,
-    }
-    })
-    const data = await res.json()
-    renderResults(data)
+    await fetchResults(url)
+  }
+}
+
+
+// GET answers are kept with their ETag: the server replies 304 while the data has not changed
+const ETAG_CACHE_SIZE = 200
+const etagCache = new Map()
+
+async function cachedFetch(url) {
+  const key = `${YOSH_ENABLED} ${url}`
+  const cached = etagCache.get(key)
+  const headers = { "X-Yosh": YOSH_ENABLED }
+  if (cached) headers["If-None-Match"] = cached.etag
+
+  const res = await fetch(API_BASE + url, { headers })
+  if (res.status === 304 && cached) return cached
+
+  const entry = {
+    data: await res.json(),
+    cursor: res.headers.get("X-Next-Cursor"),
+    etag: res.headers.get("ETag"),
+  }
+  etagCache.delete(key)
+  if (res.ok && entry.etag) {
+    etagCache.set(key, entry)
+    if (etagCache.size > ETAG_CACHE_SIZE) etagCache.delete(etagCache.keys().next().value)
+  }
+  return entry
+}
+
+
+// results are paginated: the server sends the cursor of the next page in X-Next-Cursor
+async function fetchResults(url, append = false) {
+  const { data, cursor } = await cachedFetch(url)
+  renderResults(data, append)
+
+  if (!cursor) return
+
+  const more = document.createElement("button")
+  more.className = "load-more"
+  more.textContent = "Load more"
+  more.onclick = () => {
+    more.remove()
+    const next = new URL(url, window.location.origin)
+    next.searchParams.set("cursor", cursor)
+    fetchResults(next.pathname + next.search, true)
   }
+  document.querySelector(".results").appendChild(more)
 }
 
 
@@ -236,13 +277,8 @@ function autoComplete({ selector, api, onSelect }) {
       const q = e.target.value.trim()
       if (!q) return close()
 
-      const res = await fetch(`${API_BASE}${api}?&autocomplete=true&q=${encodeURIComponent(q)}`,
-      {
-        headers: {
-      "X-Yosh": YOSH_ENABLED,
-    }
-      })
-      render(await res.json())
+      const { data } = await cachedFetch(`${api}?&autocomplete=true&q=${encodeURIComponent(q)}`)
+      render(data)
     })
 
     input.addEventListener("keydown", async e => {
@@ -369,11 +405,11 @@ function loadItemForEdit(item) {
   notify("Editing item", "info")
 }
 
-function renderResults(items) {
+function renderResults(items, append = false) {
   const container = document.querySelector(".results")
-  container.innerHTML = ""
+  if (!append) container.innerHTML = ""
 
-  if (!items.length) {
+  if (!items.length && !append) {
     container.innerHTML = "<p class='muted'>No results</p>"
     return
   }
@@ -694,6 +730,15 @@ tagInput.addEventListener('keydown', (e) => {
   }
 })
 
+// one ranked full-text search over names, tags, locations, colors... instead of one endpoint per field
+const globalSearch = document.getElementById("global-search")
+globalSearch.addEventListener("keydown", async (e) => {
+  if (e.key !== "Enter") return
+  e.preventDefault()
+  const q = globalSearch.value.trim()
+  if (q) await fetchResults(`/api/search?q=${encodeURIComponent(q)}`)
+})
+
 
 let notifyTimeout = null
 
@@ -723,11 +768,5 @@ document.getElementById("runAdvancedSearch").addEventListener("click", async ()
   if (dateBefore.value) params.set("before", dateBefore.value);
   if (tagPartial.value) params.set("tag_partial", tagPartial.value);
 
-  const res = await fetch(`${API_BASE}/api/items?${params.toString()}`, {
-    headers: {
-      "X-Yosh": YOSH_ENABLED,
-    }
-  });
-  const data = await res.json();
-  renderResults(data);
+  await fetchResults(`/api/items?${params.toString()}`);
 });
@@ -1,5 +1,12 @@
 import requests
 import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
 from requests.auth import HTTPDigestAuth
 import requests
 from urllib.parse import urlencode
@@ -59,12 +66,23 @@ GET_ENDPOINTS = [
     ("/api/items/acquired", {"q": "2025"}),
     ("/api/items/id", {"q": 1}),
     ("/api/items/group-id", {"q": 1}),
+
+    ("/api/search", {"q": "a"}),
+    ("/api/stats", {}),
+    ("/api/stats", {"by": "location"}),
+    ("/api/stats", {"by": "group"}),
+    ("/api/stats", {"by": "tag"}),
+
+    # admin only
+    ("/api/autocomplete-cache", {}),
+    ("/api/slow-queries", {}),
+    ("/metrics", {}),
 ]
 
 AUTOCOMPLETE_ENDPOINTS = [
     (path, {**params, "autocomplete": 1})
     for path, params in GET_ENDPOINTS
-    if path.startswith("/api/")
+    if path.startswith("/api/items")
 ]
 
 # -----------------------------
@@ -90,6 +108,156 @@ def test_endpoint(path, params):
         print(f"     Exception: {e}")
         print()
 
+
+def test_write(base_url, method, path, expected, **kwargs):
+    # returns the JSON answer, None when the status isn't the expected one
+    try:
+        r = session.request(method, base_url + path, timeout=TIMEOUT, **kwargs)
+    except Exception as e:
+        print(f"[!!!] {method} {path}")
+        print(f"     Exception: {e}")
+        print()
+        return None
+    print(f"[{r.status_code}] {method} {path}")
+    print(f"     Body preview: {r.text[:500]!r}")
+    if r.status_code != expected:
+        print(f"     ⚠️  ERROR: expected {expected}")
+    print()
+    return r.json() if r.status_code == expected else None
+
+
+@contextmanager
+def fresh_app(database_url):
+    """
+    a new server process on database_url, on a free port: like a server that just started or a
+    gunicorn worker before its first autocomplete, it has not built its autocomplete index yet
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "INVENTORY_DATABASE_URL": database_url, "INVENTORY_READ_DATABASE_URL": database_url,
+           "PYTHONPATH": os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")]))}
+    # users.json is read from the current directory, like the server does
+    process = subprocess.Popen([sys.executable, "-m", "flask", "--app", "app:create_app", "run", "--port", str(port)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                requests.get(url + "/", timeout=TIMEOUT)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_writes(database_url):
+    # every write endpoint, each followed by what it must have changed. returns the failures
+    failures = 0
+
+    def check(result, description):
+        nonlocal failures
+        if not result:
+            failures += 1
+            print(f"     ⚠️  FAILED: {description}\n")
+        return result
+
+    def write(method, path, expected, **kwargs):
+        return check(test_write(base_url, method, path, expected, **kwargs), f"{method} {path}")
+
+    with fresh_app(database_url) as base_url:
+        write("POST", "/api/locations", 201, json={"name": "Endpoint test"})
+        write("POST", "/api/locations", 201, json={"name": "Endpoint test shelf", "parent": "Endpoint test"})
+        write("POST", "/api/item-group", 200, json={"name": "Endpoint test group", "tags": ["endpoint-test"]})
+        # 4 levels of 99 characters fit in a path, a 5th would not
+        names = [f"Endpoint test {i} ".ljust(99, "x") for i in range(5)]
+        for parent, name in zip([None] + names, names[:4]):
+            write("POST", "/api/locations", 201, json={"name": name, "parent": parent})
+        write("POST", "/api/locations", 400, json={"name": names[4], "parent": names[3]})
+        write("POST", "/api/locations", 201, json={"name": names[4]})
+        write("POST", "/api/locations", 400, json={"name": names[4], "parent": names[3]})  # re-parent
+
+    # restarted: the group is only in the database, not in the new process
+    with fresh_app(database_url) as base_url:
+        item = write("POST", "/api/items", 201, json={
+            "group": "Endpoint test group", "location": "Endpoint test", "color": "Endpointcolor", "price": 10})
+        colors = session.get(base_url + "/api/items/color", params={"q": "endpointc", "autocomplete": 1},
+                             timeout=TIMEOUT).json()
+        check([c for c in colors if c["label"] == "Endpointcolor"], "the new item's color is autocompleted")
+
+        row = {"group": "Endpoint test group", "location": "Endpoint test shelf", "price": 5}
+        bulk = [row, {**row, "acquired_date": 20250314}, {**row, "color": ["red"]}, row]
+        created = write("POST", "/api/items/bulk", 201, json=bulk)
+        check(created and created["created"] == 2 and [e["row"] for e in created["errors"]] == [2, 3],
+              "bulk creates the good rows and reports the others")
+        ids = [i["id"] for i in session.get(base_url + "/api/items/group", params={"q": "Endpoint test group"},
+                                            timeout=TIMEOUT).json()]
+        check(len(ids) == 3, "3 items in the group")
+        write("POST", "/api/items/seen", 200, json={"ids": ids})
+        write("POST", "/api/items/move", 200, json={"ids": ids[1:], "location": "Endpoint test"})
+        groups = write("POST", "/api/item-group", 200, json=[
+            {"name": "Endpoint test group", "tags": ["endpoint-test", "moved"]},
+            {"name": "Endpoint test group", "tags": "abc"}, {"name": "Endpoint test group", "tags": [1, "x"]}])
+        check(groups and [e["row"] for e in groups["errors"]] == [2, 3], "groups with bad tags are reported")
+        write("POST", "/api/locations", 202, json={"name": "Endpoint test shelf"})  # to the top level
+        stats = session.get(base_url + "/api/stats", params={"by": "tag"}, timeout=TIMEOUT).json()
+        check([t for t in stats if t["name"] == "moved" and t["items"] == 3 and t["value"] == 20], "/api/stats by tag")
+        found = session.get(base_url + "/api/search", params={"q": "endpointcolor"}, timeout=TIMEOUT).json()
+        check([i["id"] for i in found] == [item and item["id"]], "/api/search finds the new item")
+        for path, q in [("/api/items/price", "1e999999999"), ("/api/items/price", "1e-999999999"),
+                        ("/api/items/id", "²"), ("/api/items/last-seen", "99999")]:
+            for autocomplete in (0, 1):
+                check(test_write(base_url, "GET", path, 200, params={"q": q, "autocomplete": autocomplete}) == [],
+                      f"{path}?q={q} matches nothing")
+
+        if item:
+            write("DELETE", "/api/items", 200, params={"id": item["id"]})
+        write("POST", "/api/items/delete", 200, json={"ids": ids})
+        total = session.get(base_url + "/api/stats", timeout=TIMEOUT).json()
+        check(total == {"items": 0, "value": 0}, "/api/stats is back to 0")
+    return failures
+
+
+def test_search_ranges():
+    # what a typed number or date prefix stands for, no server needed. returns the failures
+    from datetime import date
+    from decimal import Decimal
+    import search
+
+    cases = [
+        (search.numeric_range, "5", (Decimal(5), Decimal(1))),
+        (search.numeric_range, "5.2", (Decimal("5.2"), Decimal("0.1"))),
+        (search.numeric_range, "-5", (Decimal(-5), Decimal(1))),
+        (search.numeric_range, "abc", None),
+        (search.numeric_range, "nan", None),
+        (search.numeric_range, "inf", None),
+        (search.numeric_range, "1e999999999", None),
+        (search.numeric_range, "1e-999999999", None),
+        (search.numeric_range, "9" * 400, None),
+        (search.date_range, "2025", (date(2025, 1, 1), date(2025, 12, 31))),
+        (search.date_range, "2025-02", (date(2025, 2, 1), date(2025, 2, 28))),
+        (search.date_range, "2025-03-1", (date(2025, 3, 10), date(2025, 3, 19))),
+        (search.date_range, "20", (date(2000, 1, 1), date(2099, 12, 31))),
+        (search.date_range, "2025-13", None),
+        (search.date_range, "25-03", None),
+        (search.date_range, "abc", None),
+    ]
+    failures = 0
+    for function, q, expected in cases:
+        try:
+            result = function(q)
+        except Exception as e:
+            result = e
+        print(f"[{'ok' if result == expected else '!!!'}] {function.__name__}({q[:20]!r}) = {result!r}")
+        if result != expected:
+            failures += 1
+            print(f"     ⚠️  FAILED: expected {expected!r}")
+    return failures
+
 # -----------------------------
 # Run tests
 # -----------------------------
@@ -102,4 +270,12 @@ print("\n=== AUTOCOMPLETE ENDPOINTS ===\n")
 for path, params in AUTOCOMPLETE_ENDPOINTS:
     test_endpoint(path, params)
 
+print("\n=== WRITES ON A FRESH APP ===\n")
+# a throwaway SQLite database, the one of BASE_URL is left alone
+failures = test_writes(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'inventory.db')}")
+
+print("\n=== SEARCH RANGES ===\n")
+failures += test_search_ranges()
+
 print("\n=== DONE ===")
+sys.exit(1 if failures else 0)
@@ -0,0 +1,163 @@
+"""
+request-scoped timings: SQL statements and their time, counted by engine events (see db.py),
+and named phases of the view. app.py turns them into the Server-Timing header
+"""
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+MAX_STATEMENTS = 50  # SQL kept for the debug output, the counters cover every statement
+SQL_PREVIEW = 300
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self, route=None):
+        self.route = route  # "GET /api/items/tag", for the slow query log
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db = 0.0
+        self.phases = {}  # name -> [seconds, statements, db seconds]
+        self.phase = None
+        self.queries = []
+
+    def add_statement(self, statement, seconds):
+        self.statements += 1
+        self.db += seconds
+        if self.phase:
+            stats = self.phases[self.phase]
+            stats[1] += 1
+            stats[2] += seconds
+        if len(self.queries) < MAX_STATEMENTS:
+            self.queries.append({"sql": " ".join(statement.split())[:SQL_PREVIEW],
+                                 "ms": round(seconds * 1000, 3), "phase": self.phase})
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        # phases include the SQL they ran, so "db" overlaps them
+        metrics = [f'db;dur={self.db * 1000:.2f};desc="{self.statements} statements"']
+        metrics += [f"{name};dur={seconds * 1000:.2f}" for name, (seconds, _, _) in self.phases.items()]
+        metrics.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.total() * 1000, 3),
+            "db_ms": round(self.db * 1000, 3),
+            "statements": self.statements,
+            "phases": {name: {"ms": round(seconds * 1000, 3), "statements": statements,
+                              "db_ms": round(db * 1000, 3)}
+                       for name, (seconds, statements, db) in self.phases.items()},
+            "queries": self.queries,
+        }
+
+
+def start(route=None):
+    """returns the token stop() needs"""
+    return _current.set(RequestTimings(route))
+
+
+def stop(token):
+    if token is not None:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    # statements run inside are counted in this phase too. nested phases count in the inner one
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    stats = timings.phases.setdefault(name, [0.0, 0, 0.0])
+    outer, timings.phase = timings.phase, name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[0] += time.perf_counter() - started
+        timings.phase = outer
+
+
+class FetchTimedCursor(sqlite3.Cursor):
+    """
+    SQLite runs most of a SELECT while its rows are fetched, not in execute(): the fetches are
+    added to the statement's time, which is reported when SQLAlchemy closes the cursor
+    """
+    pending = None  # [seconds, report], set by after_cursor_execute
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def close(self):
+        pending, self.pending = self.pending, None
+        if pending:
+            pending[1](pending[0])
+        super().close()
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self.pending:
+                self.pending[0] += time.perf_counter() - started
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """pass as connect_args={"factory": SQLiteConnection}, see make_engine()"""
+
+    def cursor(self, factory=FetchTimedCursor):
+        return super().cursor(factory)
+
+
+def instrument(engine, *listeners):
+    """
+    time every statement of engine: it counts in the current request's timings, if any, and
+    listener(dbapi_connection, statement, parameters, context, executemany, seconds) is called
+    """
+    def report(conn, statement, parameters, context, executemany, seconds):
+        timings = _current.get()
+        if timings is not None:
+            timings.add_statement(statement, seconds)
+        for listener in listeners:
+            listener(conn, statement, parameters, context, executemany, seconds)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["timing_started"].pop()
+        dbapi_connection = conn.connection.dbapi_connection
+
+        def done(seconds):
+            report(dbapi_connection, statement, parameters, context, executemany, seconds)
+
+        if isinstance(cursor, FetchTimedCursor) and cursor.description is not None:
+            cursor.pending = [seconds, done]  # rows to fetch: reported on close()
+        else:
+            done(seconds)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("timing_started"):
+            conn.info["timing_started"].pop()
@@ -0,0 +1,45 @@
+import base64
+import hashlib
+import hmac
+import time
+
+TOKEN_COOKIE = "inventory_token"
+TOKEN_LIFETIME = 7 * 24 * 3600  # seconds
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _mac(secret, payload, password):
+    # the password is part of the signed message: changing it in users.json revokes the user's tokens
+    message = f"{payload}|{password}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).digest()
+
+
+def sign(secret: str, user: str, password: str, lifetime=TOKEN_LIFETIME) -> str:
+    """'<user|expiry>.<HMAC-SHA256>', both base64url"""
+    payload = f"{user}|{int(time.time()) + lifetime}"
+    return f"{_b64(payload.encode())}.{_b64(_mac(secret, payload, password))}"
+
+
+def verify(secret: str, token: str, get_password):
+    """the user the token was issued to, or None. get_password(user) is the users.json lookup"""
+    try:
+        payload_b64, mac_b64 = token.split(".")
+        payload = _unb64(payload_b64).decode()
+        mac = _unb64(mac_b64)
+        user, expires = payload.rsplit("|", 1)
+        expires = int(expires)
+    except ValueError:  # also covers bad base64 and utf-8
+        return None
+    password = get_password(user)
+    if password is None or expires < time.time():
+        return None
+    if not hmac.compare_digest(mac, _mac(secret, payload, password)):
+        return None
+    return user